@@ -21,7 +21,7 @@ export const ProductProvider = ({ children }) => {
     const fetchProducts = useCallback(async () => {
         try {
             setLoading(true);
-            const response = await productService.getAllProducts();
+            const response = await productService.getAllProducts({ view: 'card' });
             setProducts(response.data.products || []);
             setError(null);
         } catch (err) {
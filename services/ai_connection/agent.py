@@ -1,22 +1,44 @@
 import os
 import json
+import asyncio
+import time
+import logging
 from dotenv import load_dotenv
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Awaitable, BinaryIO, Callable, Union
 from groq import Groq
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Configure Groq
 API_KEY = os.getenv("GROQ_API_KEY")
 if not API_KEY:
-    print("⚠️ Warning: GROQ_API_KEY not found in environment variables.")
+    logger.warning("GROQ_API_KEY not found in environment variables.")
 
-client = Groq(api_key=API_KEY)
+# GROQ_BASE_URL lets the service (or a load test) point at a local stub endpoint.
+# Retries are left to the model router, which fails over instead of retrying.
+client = Groq(api_key=API_KEY, base_url=os.getenv("GROQ_BASE_URL") or None, max_retries=0)
 
 # Initial Model Configuration
-check_model = "llama-3.3-70b-versatile"
+check_model = os.getenv("AI_PRIMARY_MODEL", "llama-3.3-70b-versatile")
+fallback_model = os.getenv("AI_SECONDARY_MODEL", "llama-3.1-8b-instant")
+fast_model = os.getenv("AI_FAST_MODEL", "llama-3.1-8b-instant")  # Simple turns (cascade)
 vision_model = "llama-3.2-11b-vision-preview"
 
+from utils.model_router import ModelRouter
+from utils.cascade import classify_turn, CascadeStats, TIER_FAST, TIER_LARGE
+from utils.auth import session_id_for
+from utils.tracing import start_span, current_span
+from utils.language import ENGLISH, resolve_language, system_prompt, reply_template, quick_reply_kind
+from utils.turn_recorder import recording_turn, record_tool_call
+
+# Hedged/failover routing between the primary and secondary model
+router = ModelRouter(client, primary=check_model, secondary=fallback_model)
+
+# Fast/slow cascade bookkeeping
+cascade_stats = CascadeStats()
+
 # Import tools
 from tools.product_tool import (
     get_farmer_products,
@@ -27,10 +49,17 @@ from tools.product_tool import (
     update_product_image,
     set_session_token,
     set_pending_image,
-    CURRENT_SESSION_ID
+    set_current_session,
+    validate_tool_call,
+    start_products_prefetch,
+    finish_products_prefetch,
+    queue_tool_call,
+    BACKGROUND_TOOLS
 )
 import tools.product_tool as pt
 
+PRODUCT_KEYWORDS = [keyword for keywords in pt.CATEGORY_KEYWORDS.values() for keyword in keywords]
+
 # Tool Definitions for Groq (OpenAI-compatible schema)
 tools_schema = [
     {
@@ -131,66 +160,185 @@ available_functions = {
     "update_product_image": update_product_image
 }
 
-# System Prompt
-SYSTEM_INSTRUCTION = """
-You are AgriBot - AI assistant for farmers. You speak Tamil and English.
-
-## Your Role
-Help farmers manage products via voice.
-- If user speaks Tamil, reply in Tamil.
-- If user speaks English, reply in English.
-- Use simple words.
-- Always confirm actions.
-
-## Product Flow
-1. Check existing products first (`get_farmer_products`).
-2. If exists, update quantity (`update_product_quantity`).
-3. If new, create product (`create_product`). Auto-categorize if needed.
-
-## Categories
-Vegetables, Fruits, Grains, Pulses, Dairy, Spices, Oils, Others.
-
-## Example
-User: "I have 50kg tomatoes at 40 rupees"
-Bot: "Ok! Adding 50kg tomatoes at ₹40. Correct?"
-"""
-
-# Simple in-memory session store
+# Simple in-memory session store (one history per farmer/conversation)
 chat_histories: Dict[str, List[Dict[str, Any]]] = {}
+session_languages: Dict[str, str] = {}  # Last language used, for ambiguous turns ("ok", "50")
+MAX_HISTORY_MESSAGES = int(os.getenv("AI_MAX_HISTORY_MESSAGES", "40"))
 
-def get_history(session_id: str) -> List[Dict[str, Any]]:
+def get_history(session_id: str, language: str = ENGLISH) -> List[Dict[str, Any]]:
+    """Chat history for a session, with the compact system prompt for `language`."""
     if session_id not in chat_histories:
         chat_histories[session_id] = [
-            {"role": "system", "content": SYSTEM_INSTRUCTION}
+            {"role": "system", "content": system_prompt(language)}
         ]
+    else:
+        chat_histories[session_id][0]["content"] = system_prompt(language)
     return chat_histories[session_id]
 
-async def process_user_query(user_input: str, auth_token: Optional[str] = None, language: str = "auto") -> dict:
+
+def _message_role(message: Any) -> Optional[str]:
+    return message.get("role") if isinstance(message, dict) else getattr(message, "role", None)
+
+
+def trim_history(messages: List[Any], max_messages: int = MAX_HISTORY_MESSAGES):
+    """
+    Drop the oldest turns (in place) so the prompt stays bounded.
+    Keeps the system prompt and cuts only at a user message, so tool results
+    are never separated from the assistant message that requested them.
+    """
+    if len(messages) <= max_messages:
+        return
+    start = len(messages) - (max_messages - 1)
+    while start < len(messages) and _message_role(messages[start]) != "user":
+        start += 1
+    del messages[1:start]
+
+def _invalid_tool_call(response_message) -> str:
+    """Return the first validation error among the proposed tool calls (empty if all valid)."""
+    for tool_call in response_message.tool_calls or []:
+        try:
+            function_args = json.loads(tool_call.function.arguments or "{}")
+        except ValueError:
+            return f"{tool_call.function.name}: arguments are not valid JSON"
+        error = validate_tool_call(tool_call.function.name, function_args or {})
+        if error:
+            return error
+    return ""
+
+
+async def _complete_for_tier(tier: str, messages: List[Dict[str, Any]], **kwargs):
+    """Run a completion on the model for `tier`, recording its latency."""
+    if tier == TIER_FAST:
+        model, fallback = fast_model, check_model
+    else:
+        model, fallback = check_model, fallback_model
+    started = time.monotonic()
+    try:
+        return await router.complete(messages, model=model, fallback=fallback, **kwargs)
+    finally:
+        cascade_stats.record_latency(tier, time.monotonic() - started)
+
+
+async def _stream_for_tier(tier: str, messages: List[Dict[str, Any]], on_text: Callable[[str], Awaitable[None]]) -> str:
+    """Streamed counterpart of _complete_for_tier; returns the full text."""
+    if tier == TIER_FAST:
+        model, fallback = fast_model, check_model
+    else:
+        model, fallback = check_model, fallback_model
+    started = time.monotonic()
+    try:
+        return await router.stream(messages, on_text, model=model, fallback=fallback)
+    finally:
+        cascade_stats.record_latency(tier, time.monotonic() - started)
+
+
+EventSink = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+async def process_user_query(
+    user_input: str,
+    auth_token: Optional[str] = None,
+    language: str = "auto",
+    conversation_id: Optional[str] = None,
+    background: bool = False,
+    on_event: Optional[EventSink] = None,
+    session_id: Optional[str] = None
+) -> dict:
+    """
+    Run one chat turn.
+    With `background`, slow write tools (product create/update, image upload)
+    are queued as jobs and their ids returned in data["jobs"].
+    With `on_event` (WebSocket chat), tool progress and the reply text are
+    pushed as they happen: {"type": "tool_start" | "tool_result" | "delta", ...}.
+    `session_id` lets callers that already resolved the session skip that step.
+    `language` is "en", "ta" or "auto" (detected from the message's script).
+    The turn is recorded for replay when AI_RECORD_TURNS is set.
+    """
+    # Session context is keyed by the farmer behind the token
+    session_id = session_id or session_id_for(auth_token, conversation_id)
+    with recording_turn(session_id, user_input, language, conversation_id, background) as turn:
+        result = await _run_turn(user_input, auth_token, language, background, on_event, session_id)
+        if turn:
+            turn.response = result["response"]
+            turn.action = result["action"]
+        return result
+
+
+async def _run_turn(
+    user_input: str,
+    auth_token: Optional[str],
+    language: str,
+    background: bool,
+    on_event: Optional[EventSink],
+    session_id: str
+) -> dict:
+    language = resolve_language(language, user_input, session_languages.get(session_id))
+    session_languages[session_id] = language
     try:
-        # Set up session context (thread-safe)
-        session_id = auth_token[:16] if auth_token else "anonymous"
-        pt.CURRENT_SESSION_ID = session_id
+        set_current_session(session_id)
         set_session_token(session_id, auth_token)
         
-        messages = get_history(session_id)
+        messages = get_history(session_id, language)
         
         # Add user message
         messages.append({"role": "user", "content": user_input})
+        trim_history(messages)
+        
+        # Greetings, thanks and empty turns get a canned reply in the farmer's language
+        quick_reply = quick_reply_kind(user_input)
+        if quick_reply:
+            reply = reply_template(language, quick_reply)
+            messages.append({"role": "assistant", "content": reply})
+            cascade_stats.record_decision("template", quick_reply)
+            if on_event:
+                await on_event({"type": "delta", "text": reply})
+            return {"response": reply, "action": None, "data": None}
+        
+        # Pick the model tier for this turn
+        tier, reason = classify_turn(user_input, PRODUCT_KEYWORDS)
+        cascade_stats.record_decision(tier, reason)
+        logger.debug("Turn routed to %s model (%s)", tier, reason)
+        span = current_span()
+        if span:
+            span.set_attribute("chat.tier", tier)
+            span.set_attribute("chat.tier_reason", reason)
+            span.set_attribute("chat.language", language)
+        
+        # Speculatively load the farmer's products while the model thinks;
+        # get_farmer_products (or a name lookup) is then served from this fetch
+        start_products_prefetch(session_id, reason)
         
         # First call to LLM
-        response = client.chat.completions.create(
-            model=check_model,
-            messages=messages,
+        response = await _complete_for_tier(
+            tier,
+            messages,
             tools=tools_schema,
             tool_choice="auto",
             max_tokens=1024
         )
-        
         response_message = response.choices[0].message
+        
+        # Escalate when the fast model proposes a tool call that fails validation
+        if tier == TIER_FAST and response_message.tool_calls:
+            problem = _invalid_tool_call(response_message)
+            if problem:
+                logger.info(f"Escalating to large model: {problem}")
+                cascade_stats.record_escalation("invalid_tool_call")
+                tier = TIER_LARGE
+                response = await _complete_for_tier(
+                    tier,
+                    messages,
+                    tools=tools_schema,
+                    tool_choice="auto",
+                    max_tokens=1024
+                )
+                response_message = response.choices[0].message
+        
         messages.append(response_message)
         
         action = None
         data = None
+        jobs = []
         final_response_text = ""
 
         # Handle tool calls
@@ -208,8 +356,36 @@ async def process_user_query(user_input: str, auth_token: Optional[str] = None,
                 elif function_name == "update_product_quantity":
                     action = "product_updated"
                 
-                # Execute tool
-                tool_response = function_to_call(**function_args)
+                if on_event:
+                    await on_event({"type": "tool_start", "tool": function_name})
+                
+                # Execute tool (or hand slow writes to the job queue)
+                tool_started = time.monotonic()
+                with start_span(f"tool {function_name}", {"tool.name": function_name}) as tool_span:
+                    if background and function_name in BACKGROUND_TOOLS:
+                        tool_response = validate_tool_call(function_name, function_args)
+                        if not tool_response:
+                            job = queue_tool_call(function_name, function_args, owner=session_id_for(auth_token))
+                            jobs.append(job.id)
+                            action = "job_queued"
+                            tool_span.set_attribute("tool.job_id", job.id)
+                            tool_response = (
+                                f"Queued as background job {job.id[:8]}. Tell the farmer it is being saved "
+                                "now and will show up in their products shortly."
+                            )
+                    else:
+                        # Tools make blocking product-service calls: keep them off the event loop
+                        tool_response = await asyncio.to_thread(function_to_call, **function_args)
+                    if str(tool_response).startswith(("Error", "Failed")):
+                        tool_span.record_error(str(tool_response)[:200])
+                record_tool_call(function_name, function_args, tool_response, time.monotonic() - tool_started)
+                
+                if on_event:
+                    await on_event({
+                        "type": "tool_result",
+                        "tool": function_name,
+                        "ok": not str(tool_response).startswith(("Error", "Failed"))
+                    })
                 
                 # Add tool response to history
                 messages.append({
@@ -219,16 +395,24 @@ async def process_user_query(user_input: str, auth_token: Optional[str] = None,
                     "content": str(tool_response),
                 })
             
-            # Second call to LLM to generate final response
-            second_response = client.chat.completions.create(
-                model=check_model,
-                messages=messages
-            )
-            final_response_text = second_response.choices[0].message.content
-            messages.append(second_response.choices[0].message)
+            # Second call to LLM to generate final response (streamed when someone is listening)
+            if on_event:
+                async def send_delta(text: str):
+                    await on_event({"type": "delta", "text": text})
+                final_response_text = await _stream_for_tier(tier, messages, send_delta)
+                messages.append({"role": "assistant", "content": final_response_text})
+            else:
+                second_response = await _complete_for_tier(tier, messages)
+                final_response_text = second_response.choices[0].message.content
+                messages.append(second_response.choices[0].message)
             
         else:
             final_response_text = response_message.content
+            if on_event and final_response_text:
+                await on_event({"type": "delta", "text": final_response_text})
+        
+        if jobs:
+            data = {"jobs": jobs}
             
         return {
             "response": final_response_text,
@@ -237,59 +421,83 @@ async def process_user_query(user_input: str, auth_token: Optional[str] = None,
         }
         
     except Exception as e:
-        print(f"Agent error: {e}")
+        logger.error(f"Agent error: {e}")
         return {
-            "response": "Sorry, there was an issue. Please try again.",
+            "response": reply_template(language, "error"),
             "action": "error",
             "data": {"error": str(e)}
         }
+    finally:
+        finish_products_prefetch(session_id)
 
 async def process_user_query_with_image(
     user_input: str, 
-    image_bytes: bytes, 
+    image: Union[bytes, BinaryIO], 
     auth_token: Optional[str] = None,
-    language: str = "auto"
+    language: str = "auto",
+    conversation_id: Optional[str] = None,
+    background: bool = False
 ) -> dict:
     """
     Process a user query that includes an uploaded image.
-    The image is compressed and stored for use in product creation/update.
+    The image is resized into thumbnail/card/full renditions and stored for use
+    in product creation/update.
     No vision analysis - the main agent handles the product logic.
+    
+    Args:
+        image: Raw bytes, or a seekable file such as the spooled upload from main.py
+        background: Queue the product write/image upload as a job (see process_user_query)
     """
     try:
+        import io
         import base64
-        from utils.image_utils import compress_image, validate_image
+        from utils.image_utils import generate_renditions, FULL_RENDITION
+        from utils.upload import probe_image, file_size, UploadRejected
         
-        # Encode to base64
-        base64_image = base64.b64encode(image_bytes).decode('utf-8')
+        if isinstance(image, (bytes, bytearray)):
+            image = io.BytesIO(image)
         
         # Set up session
-        session_id = auth_token[:16] if auth_token else "anonymous"
-        pt.CURRENT_SESSION_ID = session_id
+        session_id = session_id_for(auth_token, conversation_id)
+        set_current_session(session_id)
         set_session_token(session_id, auth_token)
         
-        # Validate image
-        is_valid, error = validate_image(base64_image)
-        if not is_valid:
+        # Detect the language from the farmer's words, not the English image note below
+        language = resolve_language(language, user_input, session_languages.get(session_id))
+        
+        # Validate format and dimensions from the header (no pixel decode yet)
+        try:
+            probe_image(image)
+        except UploadRejected as e:
             return {
-                "response": f"The uploaded image is not valid. Please upload a proper image file. Error: {error}",
+                "response": f"The uploaded image is not valid. Please upload a proper image file. Error: {e.message}",
                 "action": "error",
                 "data": {}
             }
         
-        # Compress image to 2MB
-        compressed_image, success = compress_image(base64_image)
-        if not success:
-            print("⚠️ Image compression failed, using original")
-            compressed_image = base64_image
+        # Decode once and produce thumbnail/card/full renditions (full is capped at 2MB).
+        # Off the event loop: decoding a large photo takes a while.
+        try:
+            with start_span("image.renditions"):
+                renditions = await asyncio.to_thread(generate_renditions, image)
+        except Exception as e:
+            logger.warning(f"Rendition generation failed: {e}")
+            return {
+                "response": "The uploaded image could not be read. Please upload a proper image file.",
+                "action": "error",
+                "data": {}
+            }
+        compressed_image = renditions.pop(FULL_RENDITION)
         
-        # Store compressed image for product operations
-        result = set_pending_image(session_id, compressed_image)
+        # Store renditions for product operations
+        result = set_pending_image(session_id, compressed_image, renditions)
         if result != "OK":
             return {"response": result, "action": "error", "data": {}}
         
-        original_size = len(image_bytes) / 1024
+        original_size = file_size(image) / 1024
         compressed_size = len(base64.b64decode(compressed_image)) / 1024
-        print(f"📸 Image stored: {original_size:.1f}KB -> {compressed_size:.1f}KB")
+        rendition_sizes = {name: round(len(data) * 3 / 4 / 1024, 1) for name, data in renditions.items()}
+        logger.info(f"📸 Image stored: {original_size:.1f}KB -> {compressed_size:.1f}KB, renditions (KB): {rendition_sizes}")
         
         # Pass to main agent with note about the image
         # The agent will use update_product_image or create a new product with the image
@@ -299,13 +507,18 @@ async def process_user_query_with_image(
 [Image attached: The farmer has uploaded a product image. If creating or updating a product, use the update_product_image tool to attach this image to the product.]
 """
         
-        result = await process_user_query(enhanced_input, auth_token, language)
-        result["data"] = {"image_uploaded": True, "compressed_size_kb": compressed_size}
+        result = await process_user_query(enhanced_input, auth_token, language, conversation_id, background)
+        result["data"] = {
+            **(result.get("data") or {}),
+            "image_uploaded": True,
+            "compressed_size_kb": compressed_size,
+            "rendition_sizes_kb": rendition_sizes
+        }
         
         return result
         
     except Exception as e:
-        print(f"Image processing error: {e}")
+        logger.error(f"Image processing error: {e}")
         return {
             "response": "There was an error processing your image. Please try again or describe your product without an image.",
             "action": "error",
@@ -1,7 +1,9 @@
 import os
 import json
+import asyncio
+import logging
 from pathlib import Path
-from fastapi import FastAPI, HTTPException, UploadFile, File, Header, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Header, Form, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional
@@ -9,8 +11,23 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+from utils.log_config import configure_logging, logging_stats, RequestIdMiddleware
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+from utils.admission import AdmissionController, AdmissionRejected
+from utils.auth import session_id_for, rate_limit_key, token_subject, InvalidTokenError, JWT_SECRET
+from utils.upload import BodySizeLimitMiddleware, UploadRejected, spool_upload, probe_image
+import utils.image_utils  # Fails startup on a bad AI_IMAGE_RENDITIONS instead of on the first upload
+from utils.tracing import TracingMiddleware, parse_traceparent, start_span
+
 app = FastAPI(title="AgriDirect AI Service")
 
+# Refuse oversized image uploads while they stream in, before form parsing.
+# Added before CORS so CORS wraps it and the 413 carries the CORS headers.
+app.add_middleware(BodySizeLimitMiddleware, paths=["/chat/image"])
+
 # CORS Configuration - Allow frontend direct access
 origins = [
     "http://localhost:5173",
@@ -27,25 +44,94 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Server span per request, continuing the caller's W3C traceparent
+app.add_middleware(TracingMiddleware)
+
+# Request ID on every log record (outermost)
+app.add_middleware(RequestIdMiddleware)
+
+# Admission control - caps concurrent turns and rate limits each session
+admission = AdmissionController()
+
+
+def _admission_key(token: Optional[str], request: Request) -> str:
+    """Key used for per-farmer rate limiting (verified token subject, otherwise client IP)."""
+    return rate_limit_key(token, request.client.host if request.client else None)
+
+
+def _too_many_requests(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=429, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
+
+
+# WebSocket chat - one socket per voice session
+WS_MAX_CONNECTIONS = int(os.getenv("AI_WS_MAX_CONNECTIONS", "1000"))
+WS_IDLE_TIMEOUT = int(os.getenv("AI_WS_IDLE_TIMEOUT", "600"))  # Seconds without a message before closing
+ws_stats = {"open": 0, "opened": 0, "rejected": 0, "messages": 0}
+
+
 # Request/Response Models
 class ChatRequest(BaseModel):
     message: str
     language: str = "auto"  # auto, en, ta
+    conversation_id: Optional[str] = None  # Separate history per conversation (optional)
+    background: bool = False  # Queue slow product writes as jobs; poll /jobs/{id}
 
 class ChatResponse(BaseModel):
     response: str
     action: Optional[str] = None  # "product_created", "product_updated", etc.
     data: Optional[dict] = None   # Additional data for frontend
 
+@app.on_event("startup")
+def warm_marketplace_index():
+    """Start loading the marketplace search index so early searches can use it."""
+    from tools.product_tool import marketplace_index
+    from tools.marketplace_index import SEARCH_INDEX_ENABLED
+    if SEARCH_INDEX_ENABLED:
+        marketplace_index.start()
+
 # Health Check
 @app.get("/health")
 def health_check():
+    from tools.product_tool import product_breaker
+    breaker = product_breaker.snapshot()
     return {
         "service": "ai-service",
-        "status": "healthy",
-        "port": int(os.getenv("PORT", 5008))
+        "status": "healthy" if breaker["state"] == "closed" else "degraded",
+        "port": int(os.getenv("PORT", 5008)),
+        "product_service_circuit": breaker
     }
 
+@app.get("/metrics")
+def metrics():
+    from agent import router, cascade_stats
+    from tools.product_tool import prefetch_stats, marketplace_index, job_queue
+    return {
+        "service": "ai-service",
+        "admission": admission.stats(),
+        "llm_routing": router.stats(),
+        "cascade": cascade_stats.stats(),
+        "product_prefetch": prefetch_stats(),
+        "marketplace_index": marketplace_index.stats(),
+        "jobs": job_queue.stats(),
+        "websockets": dict(ws_stats),
+        "logging": logging_stats()
+    }
+
+# Background job status (async-mode product writes)
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str, authorization: Optional[str] = Header(None)):
+    """Poll a queued product write. Only the farmer who queued it can see it."""
+    from tools.product_tool import job_queue
+    
+    token = None
+    if authorization and authorization.startswith("Bearer "):
+        token = authorization.replace("Bearer ", "")
+    
+    job = job_queue.get(job_id)
+    if not job or job.owner != session_id_for(token):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
 @app.get("/")
 def read_root():
     return {"status": "AgriDirect AI Service is Running", "port": int(os.getenv("PORT", 5008))}
@@ -54,6 +140,7 @@ def read_root():
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(
     request: ChatRequest,
+    http_request: Request,
     authorization: Optional[str] = Header(None)
 ):
     """
@@ -70,22 +157,30 @@ async def chat_endpoint(
             token = authorization.replace("Bearer ", "")
         
         # Process the message with the agent
-        result = await process_user_query(request.message, token, request.language)
+        async with admission.admit(_admission_key(token, http_request)):
+            result = await process_user_query(
+                request.message, token, request.language, request.conversation_id, request.background
+            )
         
         return ChatResponse(
             response=result.get("response", "Sorry, I couldn't process that."),
             action=result.get("action"),
             data=result.get("data")
         )
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
     except Exception as e:
-        print(f"Chat error: {e}")
+        logger.error(f"Chat error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # Chat with Image Upload
 @app.post("/chat/image", response_model=ChatResponse)
 async def chat_with_image(
+    http_request: Request,
     message: str = Form(...),
     language: str = Form("auto"),
+    conversation_id: Optional[str] = Form(None),
+    background: bool = Form(False),
     image: UploadFile = File(...),
     authorization: Optional[str] = Header(None)
 ):
@@ -100,22 +195,156 @@ async def chat_with_image(
         if authorization and authorization.startswith("Bearer "):
             token = authorization.replace("Bearer ", "")
         
-        # Read image bytes
-        image_bytes = await image.read()
+        # Size cap and header-only format/dimension check before any decode
+        image_file = await spool_upload(image)
+        probe_image(image_file)
         
-        result = await process_user_query_with_image(message, image_bytes, token, language)
+        async with admission.admit(_admission_key(token, http_request)):
+            result = await process_user_query_with_image(
+                message, image_file, token, language, conversation_id, background
+            )
         
         return ChatResponse(
             response=result.get("response", "Sorry, I couldn't process that."),
             action=result.get("action"),
             data=result.get("data")
         )
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
     except Exception as e:
-        print(f"Chat with image error: {e}")
+        logger.error(f"Chat with image error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# WebSocket Chat (persistent voice sessions)
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Persistent chat over a WebSocket.
+    
+    The farmer is authenticated once, from the Authorization header or a first
+    {"type": "auth", "token": ...} message (answered with a second "ready"
+    event), and the session stays bound to the socket. Tokens are not accepted
+    in the URL, which ends up in access logs.
+    Each {"type": "message", "message": ...} runs one turn; tool_start,
+    tool_result and delta events stream back while it runs, followed by a
+    "done" event carrying the usual ChatResponse fields.
+    """
+    from agent import process_user_query
+    
+    if ws_stats["open"] >= WS_MAX_CONNECTIONS:
+        ws_stats["rejected"] += 1
+        await websocket.close(code=1013, reason="Too many connections")
+        return
+    
+    await websocket.accept()
+    ws_stats["open"] += 1
+    ws_stats["opened"] += 1
+    
+    async def receive(timeout: float) -> Optional[dict]:
+        """Next JSON message, or None when the socket has been idle too long."""
+        while True:
+            try:
+                text = await asyncio.wait_for(websocket.receive_text(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return None
+            try:
+                payload = json.loads(text)
+                if isinstance(payload, dict):
+                    return payload
+            except ValueError:
+                pass
+            await websocket.send_json({"type": "error", "status": 400, "detail": "Messages must be JSON objects"})
+    
+    try:
+        authorization = websocket.headers.get("authorization")
+        token = None
+        if authorization and authorization.startswith("Bearer "):
+            token = authorization.replace("Bearer ", "")
+        conversation_id = websocket.query_params.get("conversation_id")
+        language = websocket.query_params.get("language", "auto")
+        trace_parent = parse_traceparent(websocket.headers.get("traceparent"))
+        
+        # Authenticate once for the life of the socket
+        async def bind_session(token: Optional[str]) -> bool:
+            nonlocal session_id, admission_key
+            if token and JWT_SECRET:
+                try:
+                    token_subject(token)
+                except InvalidTokenError as e:
+                    await websocket.close(code=4401, reason=f"Invalid token: {e}")
+                    return False
+            session_id = session_id_for(token, conversation_id)
+            admission_key = rate_limit_key(token, websocket.client.host if websocket.client else None)
+            await websocket.send_json({"type": "ready", "authenticated": bool(token)})
+            return True
+        
+        session_id = admission_key = ""
+        if not await bind_session(token):
+            return
+        
+        # Browsers cannot set headers on a WebSocket: allow an auth message first
+        pending = None
+        if not token:
+            pending = await receive(WS_IDLE_TIMEOUT)
+            if pending is None:
+                await websocket.close(code=1000, reason="Idle timeout")
+                return
+            if pending.get("type") == "auth":
+                token = pending.get("token") or None
+                conversation_id = pending.get("conversation_id", conversation_id)
+                pending = None
+                if not await bind_session(token):
+                    return
+        
+        while True:
+            payload = pending or await receive(WS_IDLE_TIMEOUT)
+            pending = None
+            if payload is None:
+                await websocket.close(code=1000, reason="Idle timeout")
+                return
+            
+            if payload.get("type") == "ping":
+                await websocket.send_json({"type": "pong"})
+                continue
+            if payload.get("type") != "message" or not payload.get("message"):
+                await websocket.send_json({"type": "error", "status": 400, "detail": "Expected {\"type\": \"message\", \"message\": ...}"})
+                continue
+            
+            ws_stats["messages"] += 1
+            try:
+                # One span per turn; a message can carry its own traceparent
+                parent = parse_traceparent(payload.get("traceparent")) or trace_parent
+                with start_span("WS /ws/chat message", parent=parent):
+                    async with admission.admit(admission_key):
+                        result = await process_user_query(
+                            payload["message"],
+                            token,
+                            payload.get("language", language),
+                            conversation_id,
+                            bool(payload.get("background", False)),
+                            on_event=websocket.send_json,
+                            session_id=session_id
+                        )
+            except AdmissionRejected as e:
+                await websocket.send_json({"type": "error", "status": 429, "detail": e.reason, "retry_after": e.retry_after})
+                continue
+            
+            await websocket.send_json({
+                "type": "done",
+                "response": result.get("response", "Sorry, I couldn't process that."),
+                "action": result.get("action"),
+                "data": result.get("data")
+            })
+    except WebSocketDisconnect:
+        pass
+    finally:
+        ws_stats["open"] -= 1
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 5008))
-    print(f"🤖 Starting AgriDirect AI Service on port {port}")
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    logger.info(f"🤖 Starting AgriDirect AI Service on port {port}")
+    # log_config=None: keep the queued JSON logging set up above for uvicorn's loggers
+    uvicorn.run(app, host="0.0.0.0", port=port, log_config=None)
@@ -0,0 +1,122 @@
+"""
+Memory benchmark for concurrent image uploads.
+Pushes N concurrent large uploads through the old pipeline (read the whole
+upload, base64 it, Image.verify, decode) and the streaming one (size cap,
+spooled file, header probe, decode from file) and reports each one's peak
+RSS. Each mode runs in its own process so the peaks don't mix.
+
+Usage:
+    python scripts/bench_upload_memory.py --concurrency 8 --size-mb 20
+    AI_MAX_UPLOAD_MB=25 python scripts/bench_upload_memory.py --size-mb 20
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from starlette.datastructures import UploadFile
+
+from utils.image_utils import generate_renditions, validate_image
+from utils.upload import UploadRejected, spool_upload, probe_image
+
+STARLETTE_SPOOL_BYTES = 1024 * 1024  # Starlette spools form files to disk past 1MB
+
+
+def make_image(path: str, size_mb: float):
+    """Write a noise PNG of roughly `size_mb` (noise barely compresses)."""
+    side = int((size_mb * 1024 * 1024 / 3) ** 0.5)
+    Image.frombytes("RGB", (side, side), os.urandom(side * side * 3)).save(path, format="PNG", compress_level=1)
+
+
+def make_upload(path: str) -> UploadFile:
+    """An UploadFile as Starlette's form parser would hand it over."""
+    spool = tempfile.SpooledTemporaryFile(max_size=STARLETTE_SPOOL_BYTES)
+    with open(path, "rb") as f:
+        while chunk := f.read(64 * 1024):
+            spool.write(chunk)
+    size = spool.tell()
+    spool.seek(0)
+    return UploadFile(file=spool, size=size, filename=os.path.basename(path))
+
+
+async def legacy_upload(upload: UploadFile) -> str:
+    image_bytes = await upload.read()
+    base64_image = base64.b64encode(image_bytes).decode("utf-8")
+    is_valid, error = validate_image(base64_image)
+    if not is_valid:
+        return "rejected"
+    await asyncio.to_thread(generate_renditions, image_bytes)
+    return "accepted"
+
+
+async def streaming_upload(upload: UploadFile) -> str:
+    try:
+        image_file = await spool_upload(upload)
+        probe_image(image_file)
+    except UploadRejected:
+        return "rejected"
+    await asyncio.to_thread(generate_renditions, image_file)
+    return "accepted"
+
+
+async def run_mode(mode: str, path: str, concurrency: int) -> dict:
+    handler = legacy_upload if mode == "legacy" else streaming_upload
+    uploads = [make_upload(path) for _ in range(concurrency)]
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(handler(upload) for upload in uploads))
+    elapsed = time.perf_counter() - started
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "accepted": outcomes.count("accepted"),
+        "rejected": outcomes.count("rejected"),
+        "seconds": round(elapsed, 2),
+        "peak_rss_mb": round(peak_kb / 1024, 1),
+        "peak_rss_growth_mb": round((peak_kb - baseline_kb) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--size-mb", type=float, default=20)
+    parser.add_argument("--mode", choices=["legacy", "streaming"], help=argparse.SUPPRESS)
+    parser.add_argument("--image", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(asyncio.run(run_mode(args.mode, args.image, args.concurrency))))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "upload.png")
+        make_image(path, args.size_mb)
+        print(f"Image: {os.path.getsize(path) / 1024 / 1024:.1f}MB, concurrency {args.concurrency}")
+        for mode in ("legacy", "streaming"):
+            output = subprocess.run(
+                [sys.executable, __file__, "--mode", mode, "--image", path, "--concurrency", str(args.concurrency)],
+                capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{mode:>9}: peak RSS {result['peak_rss_mb']}MB (+{result['peak_rss_growth_mb']}MB), "
+                f"accepted {result['accepted']}, rejected {result['rejected']}, {result['seconds']}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
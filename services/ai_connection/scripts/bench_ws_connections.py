@@ -0,0 +1,148 @@
+"""
+Benchmark for concurrent open /ws/chat sockets.
+Starts the stub LLM and one uvicorn worker, opens N idle WebSocket chat
+sessions and reports the worker's memory per open socket, then sends one
+message on a batch of the open sockets at once and reports time to the
+first streamed event and to "done".
+
+Usage:
+    python scripts/bench_ws_connections.py --connections 1000 --active 50
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer
+
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_llm import make_handler
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _rss_kb(pid: int) -> int:
+    """Resident set size of a process (Linux /proc)."""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))] if ordered else 0.0
+
+
+def start_stub_llm(latency_ms: float) -> int:
+    port = _free_port()
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler({}, {}, latency_ms))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return port
+
+
+def start_service(llm_port: int, max_connections: int) -> (subprocess.Popen, int):
+    port = _free_port()
+    env = {
+        **os.environ,
+        "GROQ_API_KEY": "stub",
+        "GROQ_BASE_URL": f"http://127.0.0.1:{llm_port}",
+        "AI_WS_MAX_CONNECTIONS": str(max_connections),
+        "AI_RATE_PER_MINUTE": "0",
+        "AI_PREFETCH_PRODUCTS": "false",
+        "AI_SEARCH_INDEX": "false",
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=SERVICE_DIR, env=env
+    )
+    for _ in range(100):
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("AI service did not start")
+
+
+async def open_socket(url: str):
+    ws = await websockets.connect(url, max_size=2 ** 20, ping_interval=None)
+    ready = json.loads(await ws.recv())
+    assert ready["type"] == "ready", ready
+    return ws
+
+
+async def one_turn(ws, message: str) -> (float, float):
+    started = time.perf_counter()
+    await ws.send(json.dumps({"type": "message", "message": message}))
+    first_event = None
+    while True:
+        event = json.loads(await ws.recv())
+        if first_event is None:
+            first_event = time.perf_counter() - started
+        if event["type"] in ("done", "error"):
+            return first_event, time.perf_counter() - started
+
+
+async def run(args, port: int, pid: int):
+    url = f"ws://127.0.0.1:{port}/ws/chat"
+    baseline_kb = _rss_kb(pid)
+
+    sockets = []
+    started = time.perf_counter()
+    for batch_start in range(0, args.connections, 100):
+        batch = min(100, args.connections - batch_start)
+        sockets.extend(await asyncio.gather(*(open_socket(url) for _ in range(batch))))
+    open_seconds = time.perf_counter() - started
+    await asyncio.sleep(1)
+    idle_kb = _rss_kb(pid)
+
+    print(f"Opened {len(sockets)} sockets in {open_seconds:.2f}s")
+    print(f"Worker RSS: {baseline_kb / 1024:.1f}MB -> {idle_kb / 1024:.1f}MB "
+          f"({(idle_kb - baseline_kb) / max(1, len(sockets)):.1f}KB per idle socket)")
+
+    active = sockets[:args.active]
+    results = await asyncio.gather(*(one_turn(ws, "hello") for ws in active))
+    first = [r[0] * 1000 for r in results]
+    done = [r[1] * 1000 for r in results]
+    print(f"{len(active)} concurrent turns over open sockets: "
+          f"first event p50 {_percentile(first, 0.5):.0f}ms / p95 {_percentile(first, 0.95):.0f}ms, "
+          f"done p50 {_percentile(done, 0.5):.0f}ms / p95 {_percentile(done, 0.95):.0f}ms")
+
+    await asyncio.gather(*(ws.close() for ws in sockets))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--active", type=int, default=50, help="sockets that send a message concurrently")
+    parser.add_argument("--llm-latency", type=float, default=200, help="stub LLM latency in milliseconds")
+    args = parser.parse_args()
+
+    llm_port = start_stub_llm(args.llm_latency)
+    process, port = start_service(llm_port, args.connections + 10)
+    try:
+        asyncio.run(run(args, port, process.pid))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Replay recorded chat turns and report round-trips per turn.
+Feeds turns recorded with AI_RECORD_TURNS back through process_user_query,
+with a deterministic stub in place of Groq (it answers with the recorded
+replies and tool calls, in order) and the stub product service in place of
+the real one. For every turn it reports LLM calls, tool calls, product-service
+requests and estimated prompt tokens, and compares them with a baseline: the
+recording itself, or a report saved by an earlier replay. Changes to the
+system prompts, tools_schema or the tool functions that add round-trips or
+prompt weight show up as regressions (exit status 1).
+
+Usage:
+    AI_RECORD_TURNS=turns.jsonl python main.py      # record real conversations
+    python scripts/replay_turns.py turns.jsonl --save-baseline replay_baseline.json
+    python scripts/replay_turns.py turns.jsonl --baseline replay_baseline.json
+
+A speculative product prefetch counts as one request in the turn that
+used or discarded it, however long it took, so counts do not depend on
+timing. Image bytes are not recorded; image turns are replayed with a placeholder
+pending image. Conversations recorded mid-way start without their earlier
+history.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+from collections import deque
+from types import SimpleNamespace
+from typing import Any, Deque, Dict, List, Optional
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stub_product_service
+
+METRICS = ("llm_calls", "tool_calls", "http_requests", "prompt_tokens")
+REPLAY_TOKEN = "replay-token"
+PLACEHOLDER_IMAGE = "/9j/" + "A" * 64  # Base64 JPEG-looking stand-in for image turns
+JOB_WAIT_SECONDS = 10
+
+
+class ReplayLLM:
+    """
+    Deterministic stand-in for the Groq client.
+    Each turn is loaded with its recorded replies; calls with tools get the
+    recorded tool-calling replies in order, calls without get the recorded
+    text replies. When the agent asks for more than was recorded, it gets a
+    short plain answer, so extra round-trips end instead of looping.
+    """
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self._lock = threading.Lock()
+        self._with_tools: Deque[Dict[str, Any]] = deque()
+        self._without_tools: Deque[Dict[str, Any]] = deque()
+
+    def load(self, llm_calls: List[Dict[str, Any]]):
+        with self._lock:
+            self._with_tools = deque(c["response"] for c in llm_calls if c.get("response") and c.get("with_tools"))
+            self._without_tools = deque(c["response"] for c in llm_calls if c.get("response") and not c.get("with_tools"))
+
+    def _next_reply(self, with_tools: bool) -> Dict[str, Any]:
+        with self._lock:
+            replies = self._with_tools if with_tools else self._without_tools
+            return replies.popleft() if replies else {"content": "OK.", "tool_calls": []}
+
+    def create(self, model: str, messages: List[Any], timeout: float = None, stream: bool = False, **kwargs):
+        reply = self._next_reply(bool(kwargs.get("tools")))
+        content = reply.get("content") or ""
+        if stream:
+            words = content.split(" ")
+            return iter([
+                SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word if i == 0 else " " + word))])
+                for i, word in enumerate(words)
+            ])
+
+        tool_calls = [
+            SimpleNamespace(id=call["id"], type="function", function=SimpleNamespace(name=call["name"], arguments=call["arguments"]))
+            for call in reply.get("tool_calls") or []
+        ]
+        message = SimpleNamespace(role="assistant", content=reply.get("content"), tool_calls=tool_calls or None)
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(message=message, finish_reason="tool_calls" if tool_calls else "stop")],
+            usage=None,
+        )
+
+
+def load_turns(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(turn: Dict[str, Any]) -> Dict[str, int]:
+    return {
+        "llm_calls": len(turn["llm_calls"]),
+        "tool_calls": len(turn["tool_calls"]),
+        "http_requests": len(turn["http_requests"]),
+        "prompt_tokens": sum(call.get("prompt_tokens_est", 0) for call in turn["llm_calls"]),
+    }
+
+
+async def replay(turns: List[Dict[str, Any]], catalog: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Run every turn through the agent and return one report row per turn."""
+    server, _ = stub_product_service.start(catalog=catalog)
+    os.environ["PRODUCT_SERVICE_URL"] = f"http://127.0.0.1:{server.server_port}{stub_product_service.BASE_PATH}"
+    os.environ["AI_RECORD_TURNS"] = ""  # Collected in memory below, not appended to the recording
+    os.environ["AI_SEARCH_INDEX"] = "false"
+    os.environ.setdefault("GROQ_API_KEY", "replay")
+
+    import agent
+    import tools.product_tool as pt
+    from utils.turn_recorder import set_turn_sink
+
+    llm = ReplayLLM()
+    agent.router.client = llm
+    replayed = []
+    set_turn_sink(replayed.append)
+
+    rows = []
+    for number, recorded in enumerate(turns, 1):
+        llm.load(recorded["llm_calls"])
+        if "[Image attached" in recorded["input"]:
+            pt.set_pending_image(recorded["session"], PLACEHOLDER_IMAGE)
+
+        await agent.process_user_query(
+            recorded["input"],
+            REPLAY_TOKEN,
+            recorded.get("language", "auto"),
+            recorded.get("conversation_id"),
+            background=recorded.get("background", False),
+            session_id=recorded["session"],
+        )
+        _wait_for_jobs(pt.job_queue)  # Later turns may read what the job wrote
+
+        turn = replayed[-1]
+        rows.append({
+            "turn": number,
+            "input": recorded["input"],
+            "recorded": summarize(recorded),
+            "replay": turn.summary(),
+            "tools": [call["name"] for call in turn.tool_calls],
+            "action": turn.action,
+        })
+
+    set_turn_sink(None)
+    server.shutdown()
+    return rows
+
+
+def _wait_for_jobs(job_queue):
+    """Let queued background writes finish before the next turn runs."""
+    deadline = time.monotonic() + JOB_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        stats = job_queue.stats()
+        if not stats["depth"] and not stats["running"]:
+            return
+        time.sleep(0.01)
+
+
+def compare(rows: List[Dict[str, Any]], baseline: Optional[List[Dict[str, Any]]], token_tolerance: float) -> List[str]:
+    """Fill in each row's baseline and return the regressions found."""
+    regressions = []
+    for i, row in enumerate(rows):
+        if baseline is not None:
+            expected = baseline[i]["replay"] if i < len(baseline) and baseline[i]["input"] == row["input"] else None
+        else:
+            expected = row["recorded"]
+        row["baseline"] = expected
+        if expected is None:
+            continue
+        for metric in METRICS:
+            allowed = expected[metric] * (1 + token_tolerance) if metric == "prompt_tokens" else expected[metric]
+            if row["replay"][metric] > allowed:
+                regressions.append(f"turn {row['turn']}: {metric} {expected[metric]} -> {row['replay'][metric]}")
+    return regressions
+
+
+def _cell(value: int, expected: Optional[int]) -> str:
+    if expected is None or value == expected:
+        return str(value)
+    return f"{value} ({value - expected:+d})"
+
+
+def print_report(rows: List[Dict[str, Any]], regressions: List[str]):
+    print(f"{'turn':>4}  {'input':<40} {'llm':>8} {'tools':>8} {'http':>8} {'tokens':>12}")
+    for row in rows:
+        expected = row["baseline"] or {}
+        cells = [_cell(row["replay"][m], expected.get(m)) for m in METRICS]
+        text = " ".join(row["input"].split())
+        print(f"{row['turn']:>4}  {text[:40]:<40} {cells[0]:>8} {cells[1]:>8} {cells[2]:>8} {cells[3]:>12}")
+
+    totals = {m: sum(row["replay"][m] for row in rows) for m in METRICS}
+    print(f"{'':>4}  {'total':<40} " + " ".join(f"{totals[m]:>{w}}" for m, w in zip(METRICS, (8, 8, 8, 12))))
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s):")
+        for regression in regressions:
+            print(f"  {regression}")
+    else:
+        print("\nNo regressions against the baseline.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", help="JSON-lines file written with AI_RECORD_TURNS")
+    parser.add_argument("--baseline", help="report saved by an earlier replay (default: the recording itself)")
+    parser.add_argument("--save-baseline", help="write this replay's report here")
+    parser.add_argument("--catalog", help="JSON list of products for the stub product service")
+    parser.add_argument("--token-tolerance", type=float, default=0.05, help="allowed prompt token growth (share)")
+    args = parser.parse_args()
+
+    catalog = None
+    if args.catalog:
+        with open(args.catalog, encoding="utf-8") as f:
+            catalog = json.load(f)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["turns"]
+
+    rows = asyncio.run(replay(load_turns(args.recording), catalog))
+    regressions = compare(rows, baseline, args.token_tolerance)
+    print_report(rows, regressions)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"recording": args.recording, "turns": rows}, f, ensure_ascii=False, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Local stub for the Groq chat completions API.
+Serves OpenAI-compatible responses with injected per-model latency and error
+rates so routing, hedging and failover can be exercised without Groq.
+
+Usage:
+    python scripts/stub_llm.py --port 9100 \\
+        --latency llama-3.3-70b-versatile=6000 --latency llama-3.1-8b-instant=300 \\
+        --error-rate llama-3.3-70b-versatile=0.2
+
+    GROQ_BASE_URL=http://127.0.0.1:9100 GROQ_API_KEY=stub python main.py
+"""
+
+import json
+import time
+import random
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+
+def _parse_pairs(values, cast) -> Dict[str, float]:
+    pairs = {}
+    for value in values or []:
+        model, _, amount = value.partition("=")
+        pairs[model] = cast(amount)
+    return pairs
+
+
+def make_handler(latency_ms: Dict[str, float], error_rate: Dict[str, float], default_latency_ms: float):
+    class StubHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: dict):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _send_stream(self, model: str, content: str):
+            """Server-sent events, one word per chunk, as the streaming API sends them."""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            words = content.split(" ")
+            for i, word in enumerate(words):
+                chunk = {
+                    "id": "stub-stream",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"content": word if i == 0 else " " + word},
+                        "finish_reason": "stop" if i == len(words) - 1 else None,
+                    }],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+        def do_POST(self):
+            if not self.path.endswith("/chat/completions"):
+                self._send(404, {"error": {"message": "not found"}})
+                return
+
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            model = request.get("model", "")
+
+            time.sleep(latency_ms.get(model, default_latency_ms) / 1000.0)
+
+            if random.random() < error_rate.get(model, 0.0):
+                self._send(503, {"error": {"message": f"injected failure for {model}"}})
+                return
+
+            content = f"[{model}] ok"
+            if request.get("stream"):
+                self._send_stream(model, content)
+                return
+
+            self._send(200, {
+                "id": f"stub-{int(time.time() * 1000)}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+
+    return StubHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Groq endpoint with injected latency")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", action="append", help="model=milliseconds")
+    parser.add_argument("--error-rate", action="append", help="model=fraction (0-1)")
+    parser.add_argument("--default-latency", type=float, default=200, help="milliseconds for unlisted models")
+    args = parser.parse_args()
+
+    handler = make_handler(
+        _parse_pairs(args.latency, float),
+        _parse_pairs(args.error_rate, float),
+        args.default_latency,
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), handler)
+    print(f"🧪 Stub LLM listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Local stub for the product service.
+Serves the endpoints the product tools call (my-products, get/update by id,
+create, search) from an in-memory catalog and counts requests, so tool
+behaviour and round-trips can be measured without MongoDB or the Node service.
+Any bearer token is accepted and every caller sees the same catalog.
+
+Usage:
+    python scripts/stub_product_service.py --port 9200 [--catalog products.json]
+
+    PRODUCT_SERVICE_URL=http://127.0.0.1:9200/api/products python main.py
+"""
+
+import re
+import json
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+BASE_PATH = "/api/products"
+
+DEFAULT_CATALOG = [
+    {"productName": "Tomato", "currentQuantity": 50, "price": 40, "category": "Vegetables"},
+    {"productName": "Onion", "currentQuantity": 100, "price": 30, "category": "Vegetables"},
+    {"productName": "Potato", "currentQuantity": 80, "price": 25, "category": "Vegetables"},
+    {"productName": "Banana", "currentQuantity": 60, "price": 50, "category": "Fruits"},
+    {"productName": "Ponni Rice", "currentQuantity": 200, "price": 60, "category": "Grains"},
+]
+
+
+class ProductStore:
+    """The stub's catalog plus request counters."""
+
+    def __init__(self, catalog: Optional[List[Dict[str, Any]]] = None):
+        self._lock = threading.Lock()
+        self.products: Dict[str, Dict[str, Any]] = {}
+        self.requests: Counter = Counter()
+        for product in catalog if catalog is not None else DEFAULT_CATALOG:
+            self._add(dict(product))
+
+    def _add(self, product: Dict[str, Any]) -> Dict[str, Any]:
+        product_id = product.get("_id") or f"{len(self.products) + 1:024x}"  # ObjectId-shaped
+        product.setdefault("ownerName", "Stub Farmer")
+        self.products[product_id] = {**product, "_id": product_id}
+        return self.products[product_id]
+
+    def create(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            product = {k: v for k, v in body.items() if k != "quantity"}
+            product["currentQuantity"] = body.get("quantity", 0)
+            return self._add(product)
+
+    def update(self, product_id: str, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            product = self.products.get(product_id)
+            if product is None:
+                return None
+            if "quantity" in body:
+                product["currentQuantity"] = body["quantity"]
+            product.update({k: v for k, v in body.items() if k != "quantity"})
+            return product
+
+    def search(self, query: str) -> List[Dict[str, Any]]:
+        query = query.lower()
+        return [p for p in self.products.values() if query in p.get("productName", "").lower()]
+
+
+def make_handler(store: ProductStore):
+    class StubHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: dict):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _route(self) -> (str, Dict[str, List[str]]):
+            url = urlsplit(self.path)
+            path = url.path[len(BASE_PATH):] if url.path.startswith(BASE_PATH) else None
+            label = re.sub(r"/[0-9a-f]{24}$", "/:id", url.path)
+            store.requests[f"{self.command} {label}"] += 1
+            return path, parse_qs(url.query)
+
+        def _body(self) -> Dict[str, Any]:
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            path, query = self._route()
+            if path == "/my-products":
+                products = list(store.products.values())
+                if query.get("view") == ["summary"]:
+                    products = [{k: v for k, v in p.items() if k not in ("image", "imageRenditions")} for p in products]
+                return self._send(200, {"success": True, "products": products})
+            if path in ("", "/"):
+                products = store.search(query.get("search", [""])[0])
+                page = int(query.get("page", ["1"])[0])
+                limit = int(query.get("limit", [str(len(products) or 1)])[0])
+                return self._send(200, {"success": True, "products": products[(page - 1) * limit:page * limit]})
+            product = store.products.get((path or "").lstrip("/"))
+            if product:
+                return self._send(200, {"success": True, "product": product})
+            self._send(404, {"success": False, "message": "Product not found"})
+
+        def do_POST(self):
+            path, _ = self._route()
+            if path not in ("", "/"):
+                return self._send(404, {"success": False, "message": "Not found"})
+            self._send(201, {"success": True, "product": store.create(self._body())})
+
+        def do_PUT(self):
+            path, _ = self._route()
+            product = store.update((path or "").lstrip("/"), self._body())
+            if product is None:
+                return self._send(404, {"success": False, "message": "Product not found"})
+            self._send(200, {"success": True, "product": product})
+
+    return StubHandler
+
+
+def start(port: int = 0, catalog: Optional[List[Dict[str, Any]]] = None) -> (ThreadingHTTPServer, ProductStore):
+    """Serve a fresh catalog on a background thread (port 0 picks a free one)."""
+    store = ProductStore(catalog)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(store))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--catalog", help="JSON file with a list of products to start with")
+    args = parser.parse_args()
+
+    catalog = None
+    if args.catalog:
+        with open(args.catalog, encoding="utf-8") as f:
+            catalog = json.load(f)
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(ProductStore(catalog)))
+    print(f"Stub product service on http://127.0.0.1:{args.port}{BASE_PATH}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
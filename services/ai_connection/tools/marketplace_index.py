@@ -0,0 +1,209 @@
+"""
+In-process marketplace search index.
+Keeps an inverted index of active marketplace products (names normalized
+with the same Tamil/English aliases as the farmer product index) so
+search_products can answer from memory. A background thread applies the
+product service's change feed and periodically rebuilds from scratch.
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from tools.product_index import normalize_product_name
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SEARCH_INDEX_ENABLED = os.getenv("AI_SEARCH_INDEX", "true").lower() == "true"
+REFRESH_INTERVAL_SECONDS = int(os.getenv("AI_SEARCH_REFRESH_SECONDS", "30"))
+FULL_REFRESH_SECONDS = int(os.getenv("AI_SEARCH_FULL_REFRESH_SECONDS", "600"))
+MAX_STALENESS_SECONDS = int(os.getenv("AI_SEARCH_MAX_STALENESS", "300"))
+PAGE_SIZE = 200
+MAX_PAGES = 100
+
+# Field weights for relevance scoring
+NAME_WEIGHT = 3.0
+CATEGORY_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 0.5
+EXACT_NAME_BONUS = 2.0
+
+INDEXED_FIELDS = ("_id", "productName", "ownerName", "price", "currentQuantity", "quantity", "category", "city")
+
+_TOKEN_RE = re.compile(r"[\w\u0B80-\u0BFF]+")
+
+# (params) -> list of product dicts; provided by product_tool so HTTP stays there
+FetchPage = Callable[[Dict[str, Any]], List[Dict[str, Any]]]
+
+
+def tokenize(text: str) -> List[str]:
+    """Split into normalized tokens (lowercase, singular, Tamil aliased to English)."""
+    return [
+        part
+        for token in _TOKEN_RE.findall((text or "").lower())
+        for part in normalize_product_name(token).split()
+    ]
+
+
+class MarketplaceIndex:
+    """Inverted index over marketplace products, safe to read while refreshing."""
+
+    def __init__(self, fetch_page: FetchPage):
+        self._fetch_page = fetch_page
+        self._lock = threading.RLock()
+        self._products: Dict[str, Dict[str, Any]] = {}
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)  # token -> {product_id: weight}
+        self._tokens: Dict[str, Set[str]] = {}  # product_id -> tokens (for removal)
+        self._names: Dict[str, str] = {}  # product_id -> normalized name
+        self._cursor: Optional[str] = None  # max updatedAt seen
+        self._refreshed_at: Optional[float] = None
+        self._full_refreshed_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"searches": 0, "served_from_index": 0, "refreshes": 0, "full_refreshes": 0, "refresh_errors": 0}
+
+    # --- Index maintenance -------------------------------------------------
+
+    def _remove(self, product_id: str):
+        for token in self._tokens.pop(product_id, ()):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[token]
+        self._products.pop(product_id, None)
+        self._names.pop(product_id, None)
+
+    def _upsert(self, product: Dict[str, Any]):
+        product_id = product.get("_id")
+        if not product_id:
+            return
+        self._remove(product_id)
+
+        quantity = product.get("currentQuantity", product.get("quantity", 0)) or 0
+        if product.get("isActive") is False or quantity <= 0:
+            return
+
+        weights: Dict[str, float] = defaultdict(float)
+        for token in tokenize(product.get("productName", "")):
+            weights[token] += NAME_WEIGHT
+        for token in tokenize(product.get("category", "")):
+            weights[token] += CATEGORY_WEIGHT
+        for token in tokenize(product.get("description", "")):
+            weights[token] += DESCRIPTION_WEIGHT
+
+        for token, weight in weights.items():
+            self._postings[token][product_id] = weight
+        self._tokens[product_id] = set(weights)
+        self._products[product_id] = {key: product[key] for key in INDEXED_FIELDS if key in product}
+        self._names[product_id] = normalize_product_name(product.get("productName", ""))
+
+    def apply(self, products: List[Dict[str, Any]]):
+        """Apply a batch of new/changed products (inactive or sold-out ones are evicted)."""
+        with self._lock:
+            for product in products:
+                self._upsert(product)
+                updated_at = product.get("updatedAt")
+                if updated_at and (self._cursor is None or updated_at > self._cursor):
+                    self._cursor = updated_at
+
+    def _fetch_all(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        products: List[Dict[str, Any]] = []
+        for page in range(1, MAX_PAGES + 1):
+            batch = self._fetch_page({**params, "page": page, "limit": PAGE_SIZE, "view": "summary"})
+            products.extend(batch)
+            if len(batch) < PAGE_SIZE:
+                break
+        return products
+
+    def refresh(self, full: bool = False):
+        """Pull changes since the last cursor, or rebuild everything when `full` (or no cursor yet)."""
+        now = time.monotonic()
+        full = full or self._cursor is None or self._full_refreshed_at is None \
+            or now - self._full_refreshed_at >= FULL_REFRESH_SECONDS
+        try:
+            if full:
+                products = self._fetch_all({})
+                with self._lock:
+                    self._products.clear()
+                    self._postings.clear()
+                    self._tokens.clear()
+                    self._names.clear()
+                    self._cursor = None
+                    self.apply(products)
+                    self._full_refreshed_at = now
+                self._stats["full_refreshes"] += 1
+            else:
+                self.apply(self._fetch_all({"updatedSince": self._cursor}))
+            with self._lock:
+                self._refreshed_at = now
+            self._stats["refreshes"] += 1
+        except Exception as e:
+            self._stats["refresh_errors"] += 1
+            logger.warning(f"Marketplace index refresh failed: {e}")
+
+    def _run(self):
+        while True:
+            self.refresh()
+            time.sleep(REFRESH_INTERVAL_SECONDS)
+
+    def start(self):
+        """Start the background refresher (idempotent)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="marketplace-index", daemon=True)
+            self._thread.start()
+
+    # --- Queries -----------------------------------------------------------
+
+    def staleness(self) -> Optional[float]:
+        """Seconds since the last successful refresh (None if never loaded)."""
+        if self._refreshed_at is None:
+            return None
+        return time.monotonic() - self._refreshed_at
+
+    def is_fresh(self, max_staleness: float = MAX_STALENESS_SECONDS) -> bool:
+        staleness = self.staleness()
+        return staleness is not None and staleness <= max_staleness
+
+    def search(self, query: str, limit: int = 5) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Rank products by relevance, then price (cheapest first).
+
+        Returns:
+            Tuple of (total_matches, top `limit` products)
+        """
+        tokens = tokenize(query)
+        normalized_query = normalize_product_name(query)
+        scores: Dict[str, float] = defaultdict(float)
+        with self._lock:
+            for token in tokens:
+                for product_id, weight in self._postings.get(token, {}).items():
+                    scores[product_id] += weight
+            for product_id in scores:
+                if self._names.get(product_id) == normalized_query:
+                    scores[product_id] += EXACT_NAME_BONUS
+            ranked = sorted(
+                scores.items(),
+                key=lambda item: (-item[1], self._products[item[0]].get("price") or 0)
+            )
+            return len(ranked), [dict(self._products[product_id]) for product_id, _ in ranked[:limit]]
+
+    def record_search(self, served_from_index: bool):
+        self._stats["searches"] += 1
+        if served_from_index:
+            self._stats["served_from_index"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        staleness = self.staleness()
+        return {
+            **self._stats,
+            "enabled": SEARCH_INDEX_ENABLED,
+            "products": len(self._products),
+            "tokens": len(self._postings),
+            "staleness_seconds": round(staleness, 1) if staleness is not None else None,
+        }
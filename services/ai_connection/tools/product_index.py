@@ -0,0 +1,204 @@
+"""
+Per-farmer product name index.
+Maps normalized product names (plurals, spacing, Tamil/English aliases) to
+product IDs so update tools can resolve "tomatoes" or "தக்காளி" to the
+"Tomato" listing without downloading the whole product list every time.
+"""
+
+import os
+import re
+import time
+import difflib
+import logging
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+INDEX_TTL_SECONDS = int(os.getenv("AI_PRODUCT_INDEX_TTL", "120"))
+MATCH_THRESHOLD = float(os.getenv("AI_PRODUCT_MATCH_THRESHOLD", "0.75"))
+AMBIGUITY_MARGIN = 0.05
+
+# Tamil (and alternate English) names mapped to the canonical English name.
+# Tamil entries mirror the categorize_product vocabulary.
+PRODUCT_ALIASES: Dict[str, str] = {
+    "தக்காளி": "tomato",
+    "வெங்காயம்": "onion",
+    "உருளைக்கிழங்கு": "potato",
+    "கேரட்": "carrot",
+    "கத்திரிக்காய்": "brinjal",
+    "மாம்பழம்": "mango",
+    "வாழைப்பழம்": "banana",
+    "ஆப்பிள்": "apple",
+    "ஆரஞ்சு": "orange",
+    "திராட்சை": "grapes",
+    "அரிசி": "rice",
+    "கோதுமை": "wheat",
+    "சோளம்": "corn",
+    "கேழ்வரகு": "ragi",
+    "பருப்பு": "dal",
+    "கடலை": "chickpea",
+    "மஞ்சள்": "turmeric",
+    "மிளகு": "pepper",
+    "இஞ்சி": "ginger",
+    "பூண்டு": "garlic",
+    "நல்லெண்ணெய்": "sesame oil",
+    "தேங்காய் எண்ணெய்": "coconut oil",
+    "eggplant": "brinjal",
+    "aubergine": "brinjal",
+    "okra": "ladyfinger",
+    "lady finger": "ladyfinger",
+    "bhindi": "ladyfinger",
+    "maize": "corn",
+    "finger millet": "ragi",
+    "chana": "chickpea",
+    "lentil": "dal",
+    "gingelly oil": "sesame oil",
+}
+
+# Product fields kept in the index (listings can carry multi-MB data-URL images)
+INDEXED_FIELDS = ("_id", "productName", "currentQuantity", "quantity", "price", "category")
+
+# Words whose trailing "s" is not a plural
+_NON_PLURALS = {"peas", "grapes", "oats", "beans", "lentils", "chickpeas", "asparagus", "citrus"}
+_PUNCTUATION_RE = re.compile(r"[^\w\s\u0B80-\u0BFF]")
+
+
+def _singular(word: str) -> str:
+    """Naive English singularization (tomatoes -> tomato, berries -> berry)."""
+    if word in _NON_PLURALS or len(word) <= 3:
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes", "xes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def normalize_product_name(name: str) -> str:
+    """
+    Normalize a product name for matching.
+    Lowercases, strips punctuation, collapses whitespace, singularizes
+    English words and maps Tamil/alternate names to the canonical name.
+    """
+    text = _PUNCTUATION_RE.sub(" ", (name or "").lower())
+    text = " ".join(text.split())
+    if text in PRODUCT_ALIASES:
+        return PRODUCT_ALIASES[text]
+    words = [PRODUCT_ALIASES.get(word, _singular(word)) for word in text.split()]
+    text = " ".join(words)
+    return PRODUCT_ALIASES.get(text, text)
+
+
+def _is_word_match(query: str, candidate: str) -> bool:
+    """Same normalized name (aliases included), or all of the query's words: "tomato" vs "country tomato"."""
+    query_words = set(query.split())
+    return query == candidate or bool(query_words) and query_words <= set(candidate.split())
+
+
+def _similarity(query: str, candidate: str) -> float:
+    """Score two normalized names between 0 and 1."""
+    if query == candidate:
+        return 1.0
+    if _is_word_match(query, candidate):
+        return 0.9
+    return difflib.SequenceMatcher(None, query, candidate).ratio()
+
+
+@dataclass
+class FarmerProductIndex:
+    """Name -> product lookup for one farmer's listings."""
+    products: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    names: Dict[str, str] = field(default_factory=dict)  # product id -> normalized name
+    built_at: float = field(default_factory=time.monotonic)
+
+    @classmethod
+    def from_products(cls, products: List[Dict[str, Any]]) -> "FarmerProductIndex":
+        index = cls()
+        for product in products:
+            index.add(product)
+        return index
+
+    def add(self, product: Dict[str, Any]):
+        product_id = product.get("_id")
+        if not product_id:
+            return
+        self.products[product_id] = {key: product[key] for key in INDEXED_FIELDS if key in product}
+        self.names[product_id] = normalize_product_name(product.get("productName", ""))
+
+    def set_field(self, product_id: str, key: str, value: Any):
+        if product_id in self.products:
+            self.products[product_id][key] = value
+
+    def age(self) -> float:
+        return time.monotonic() - self.built_at
+
+    def is_fresh(self, ttl: float = INDEX_TTL_SECONDS) -> bool:
+        return self.age() < ttl
+
+    def rank(self, product_name: str, limit: int = 3) -> List[Tuple[float, Dict[str, Any]]]:
+        """Return up to `limit` (score, product) pairs, best first."""
+        query = normalize_product_name(product_name)
+        if not query:
+            return []
+        scored = [
+            (_similarity(query, name), self.products[product_id])
+            for product_id, name in self.names.items()
+        ]
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return scored[:limit]
+
+    def resolve(self, product_name: str) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Resolve a spoken product name to a single listing.
+        Only exact (normalized or alias) and whole-word matches are resolved;
+        names that are merely similar ("peas" vs "Pears", "coin" vs "Corn")
+        come back as candidates for the farmer to confirm, since the result
+        is used for writes.
+
+        Returns:
+            Tuple of (matched_product or None, close candidates when ambiguous/unmatched)
+        """
+        ranked = [pair for pair in self.rank(product_name) if pair[0] >= MATCH_THRESHOLD]
+        if not ranked:
+            return None, []
+        query = normalize_product_name(product_name)
+        matches = [pair for pair in ranked if _is_word_match(query, self.names[pair[1]["_id"]])]
+        if not matches:
+            return None, [product for _, product in ranked]
+        best_score, best = matches[0]
+        if best_score < 1.0 and len(matches) > 1 and best_score - matches[1][0] < AMBIGUITY_MARGIN:
+            return None, [product for _, product in matches]
+        return best, []
+
+
+# Per-session index cache
+_indexes: Dict[str, FarmerProductIndex] = {}
+_index_lock = Lock()
+
+
+def store_index(session_id: str, products: List[Dict[str, Any]]) -> FarmerProductIndex:
+    """Build and cache the index from a fresh product list."""
+    index = FarmerProductIndex.from_products(products)
+    with _index_lock:
+        _indexes[session_id] = index
+    logger.debug("Session %s...: Product index built (%d products)", session_id[:8], len(products))
+    return index
+
+
+def get_cached_index(session_id: str, allow_stale: bool = False) -> Optional[FarmerProductIndex]:
+    """Return the cached index if it is still fresh (or at all, with allow_stale)."""
+    with _index_lock:
+        index = _indexes.get(session_id)
+    if index and (allow_stale or index.is_fresh()):
+        return index
+    return None
+
+
+def invalidate_index(session_id: str):
+    with _index_lock:
+        _indexes.pop(session_id, None)
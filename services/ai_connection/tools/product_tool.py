@@ -12,13 +12,28 @@ Refactored for:
 
 import requests
 import os
+import re
+import time
+import inspect
 import logging
-from typing import Optional, Dict, Any
+import contextvars
+from collections import Counter
+from urllib.parse import urlsplit
+from urllib3.exceptions import NewConnectionError
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple
+from contextvars import ContextVar
 from dataclasses import dataclass, field
 from threading import Lock
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from tools.product_index import FarmerProductIndex, store_index, get_cached_index
+from tools.marketplace_index import MarketplaceIndex, SEARCH_INDEX_ENABLED
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError, OPEN
+from utils.job_queue import Job, JobQueue
+from utils.tracing import start_span, inject_headers
+from utils.log_config import bind_session_id
+from utils.turn_recorder import record_http, detach_turn
+
 logger = logging.getLogger(__name__)
 
 # Product Service URL
@@ -28,6 +43,8 @@ PRODUCT_SERVICE_URL = os.getenv("PRODUCT_SERVICE_URL", "http://localhost:5003/ap
 REQUEST_TIMEOUT = int(os.getenv("AI_REQUEST_TIMEOUT", "10"))
 MAX_IMAGE_SIZE_MB = int(os.getenv("AI_MAX_IMAGE_SIZE_MB", "2"))
 MAX_IMAGE_SIZE_BYTES = MAX_IMAGE_SIZE_MB * 1024 * 1024
+PREFETCH_PRODUCTS = os.getenv("AI_PREFETCH_PRODUCTS", "true").lower() == "true"
+PREFETCH_WORKERS = int(os.getenv("AI_PREFETCH_WORKERS", "4"))
 
 
 @dataclass
@@ -35,6 +52,10 @@ class SessionContext:
     """Thread-safe session context for each user request."""
     auth_token: Optional[str] = None
     pending_image: Optional[str] = None
+    pending_renditions: Dict[str, str] = field(default_factory=dict)  # e.g. thumbnail/card, base64
+    prefetch: Optional[Future] = None  # In-flight speculative /my-products fetch
+    prefetch_label: str = ""
+    prefetch_started: float = 0.0
     
 
 # Session storage with thread safety
@@ -54,12 +75,12 @@ def set_session_token(session_id: str, token: Optional[str]):
     """Set auth token for a session."""
     session = get_session(session_id)
     session.auth_token = token
-    logger.debug(f"Session {session_id[:8]}...: Token set (present: {bool(token)})")
+    logger.debug("Session %s...: Token set (present: %s)", session_id[:8], bool(token))
 
 
-def set_pending_image(session_id: str, base64_image: str) -> str:
+def set_pending_image(session_id: str, base64_image: str, renditions: Optional[Dict[str, str]] = None) -> str:
     """
-    Store an uploaded image for the session.
+    Store an uploaded image (and its smaller renditions) for the session.
     Returns error message if image too large.
     """
     if len(base64_image) > MAX_IMAGE_SIZE_BYTES:
@@ -67,7 +88,8 @@ def set_pending_image(session_id: str, base64_image: str) -> str:
     
     session = get_session(session_id)
     session.pending_image = base64_image
-    logger.debug(f"Session {session_id[:8]}...: Pending image set (size: {len(base64_image)} bytes)")
+    session.pending_renditions = dict(renditions or {})
+    logger.debug("Session %s...: Pending image set (size: %d bytes)", session_id[:8], len(base64_image))
     return "OK"
 
 
@@ -79,6 +101,36 @@ def get_and_clear_pending_image(session_id: str) -> Optional[str]:
     return img
 
 
+def get_and_clear_pending_renditions(session_id: str) -> Dict[str, str]:
+    """Get and clear the pending image renditions as data URLs (name -> URL)."""
+    session = get_session(session_id)
+    renditions = session.pending_renditions
+    session.pending_renditions = {}
+    return {name: f"data:image/jpeg;base64,{data}" for name, data in renditions.items()}
+
+
+# Image handed to a queued write by its job, so retries never go through
+# (or clobber) the session's shared pending-image slot
+_job_image: ContextVar[Optional[Tuple[Optional[str], Dict[str, str]]]] = ContextVar("job_image", default=None)
+
+
+def _has_pending_image(session_id: str) -> bool:
+    job_image = _job_image.get()
+    return bool(job_image[0]) if job_image is not None else bool(get_session(session_id).pending_image)
+
+
+def _take_pending_image(session_id: str) -> Tuple[Optional[str], Dict[str, str]]:
+    """
+    The image for this write and its renditions as data URLs: the queued
+    job's own image, or else the session's pending upload (which is cleared).
+    """
+    job_image = _job_image.get()
+    if job_image is not None:
+        image, renditions = job_image
+        return image, {name: f"data:image/jpeg;base64,{data}" for name, data in renditions.items()}
+    return get_and_clear_pending_image(session_id), get_and_clear_pending_renditions(session_id)
+
+
 def _get_headers(session_id: str) -> dict:
     """Get headers with auth token if available."""
     headers = {"Content-Type": "application/json"}
@@ -101,8 +153,272 @@ def _validate_positive_int(value: Any, name: str, max_value: int = 1000000) -> t
         return False, f"{name} must be a valid number.", 0
 
 
-# Current session ID (set by agent before each call)
-CURRENT_SESSION_ID: str = "default"
+class ProductServiceAuthError(requests.exceptions.RequestException):
+    """Product service rejected the farmer's token (HTTP 401)."""
+
+
+class ProductServiceUnreachable(requests.exceptions.ConnectionError):
+    """No connection to the product service could be opened, so the request never reached it."""
+
+
+SERVICE_UNAVAILABLE_MESSAGE = "Error: The product service is temporarily unavailable. Please try again in a minute."
+
+# Circuit breaker shared by every call to the product service
+product_breaker = CircuitBreaker("product-service")
+
+
+_OBJECT_ID_RE = re.compile(r"/[0-9a-fA-F]{24}(?=/|$)")
+
+
+def _is_server_error(response: requests.Response) -> bool:
+    return response.status_code >= 500
+
+
+def _never_connected(error: requests.RequestException) -> bool:
+    """True for connect failures (refused, DNS, connect timeout), where nothing was sent."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.exceptions.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+def _product_request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Call the product service through the circuit breaker, in its own span
+    with the trace context propagated (traceparent header).
+    Raises CircuitOpenError without calling when the service is known to be down,
+    and ProductServiceUnreachable when no connection could be opened.
+    """
+    kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+    path = _OBJECT_ID_RE.sub("/:id", urlsplit(url).path)  # Keep span names low-cardinality
+    with start_span(f"product-service {method} {path}", {"http.method": method, "http.url": url}) as span:
+        kwargs["headers"] = inject_headers(dict(kwargs.get("headers") or {}))
+        started = time.monotonic()
+        try:
+            response = product_breaker.call(requests.request, method, url, is_failure=_is_server_error, **kwargs)
+        except requests.RequestException as e:
+            record_http(method, path, None, time.monotonic() - started)
+            if _never_connected(e):
+                raise ProductServiceUnreachable(*e.args, request=e.request) from e
+            raise
+        record_http(method, path, response.status_code, time.monotonic() - started)
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.status = "error"
+        return response
+
+
+def _product_service_down() -> bool:
+    """True while the breaker is open, so write tools can fail fast."""
+    return product_breaker.state == OPEN
+
+
+def _refresh_product_index(session_id: str) -> FarmerProductIndex:
+    """Download the farmer's listings once (without images) and rebuild their name index."""
+    response = _product_request(
+        "GET",
+        f"{PRODUCT_SERVICE_URL}/my-products",
+        params={"view": "summary"},
+        headers=_get_headers(session_id),
+        timeout=REQUEST_TIMEOUT
+    )
+    logger.debug("Response status: %s", response.status_code)
+    
+    if response.status_code == 401:
+        raise ProductServiceAuthError("Authentication failed")
+    
+    response.raise_for_status()
+    return store_index(session_id, response.json().get("products", []))
+
+
+def _resolve_product(session_id: str, product_name: str) -> tuple[Optional[dict], str]:
+    """
+    Resolve a spoken product name to one of the farmer's listings.
+    Uses this turn's prefetch if there is one, else the cached name index; the
+    product list is only downloaded when neither is available, or once more if
+    a cached index has no exact match.
+    
+    Returns:
+        Tuple of (product, error_message)
+    """
+    index = _take_prefetched_index(session_id)  # Started this turn, so newer than the cache
+    from_cache = False
+    if index is None:
+        index = get_cached_index(session_id)
+        from_cache = index is not None
+    if index is None:
+        index = _refresh_product_index(session_id)
+    
+    product, candidates = index.resolve(product_name)
+    if product is None and from_cache:
+        # The listing may have been added elsewhere since the index was built
+        index = _refresh_product_index(session_id)
+        product, candidates = index.resolve(product_name)
+    
+    if len(candidates) == 1:
+        return None, f"No product is named exactly '{product_name}'. Did you mean {candidates[0].get('productName', '')}? Ask the farmer to confirm."
+    if candidates:
+        names = ", ".join(p.get("productName", "") for p in candidates)
+        return None, f"'{product_name}' matches several of your products: {names}. Which one did you mean?"
+    if product is None:
+        return None, f"Could not find product '{product_name}' in your listings."
+    return product, ""
+
+
+# Speculative prefetch of /my-products, started alongside the first LLM call
+_prefetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+_prefetch_lock = Lock()
+_prefetch_counts: Dict[str, Counter] = {"started": Counter(), "hits": Counter(), "waste": Counter(), "errors": Counter()}
+_prefetch_wait_seconds = 0.0
+
+
+def _count_prefetch(kind: str, label: str):
+    with _prefetch_lock:
+        _prefetch_counts[kind][label] += 1
+
+
+def start_products_prefetch(session_id: str, label: str = "default") -> bool:
+    """
+    Start fetching the farmer's products in the background.
+    `label` (e.g. the turn's routing reason) groups the hit/waste counters.
+    Confirmation turns ("yes", "ok") skip it while the cached index is fresh:
+    they rarely list products and any name lookup is served from the index.
+    
+    Returns:
+        True if a prefetch was started.
+    """
+    session = get_session(session_id)
+    if not PREFETCH_PRODUCTS or not session.auth_token or session.prefetch is not None:
+        return False
+    if label == "confirmation" and get_cached_index(session_id) is not None:
+        return False
+    
+    context = contextvars.copy_context()
+    context.run(detach_turn)  # Recorded when consumed or wasted (see _record_prefetch)
+    session.prefetch = _prefetch_executor.submit(context.run, _refresh_product_index, session_id)
+    session.prefetch_label = label
+    session.prefetch_started = time.monotonic()
+    _count_prefetch("started", label)
+    return True
+
+
+def _record_prefetch(session: SessionContext, future: Future):
+    """Count the prefetch's /my-products request against the turn, whether or not it has finished."""
+    status = None
+    if future.done() and not future.cancelled():
+        error = future.exception()
+        status = 401 if isinstance(error, ProductServiceAuthError) else (200 if error is None else None)
+    path = _OBJECT_ID_RE.sub("/:id", urlsplit(PRODUCT_SERVICE_URL).path) + "/my-products"
+    record_http("GET", path, status, time.monotonic() - session.prefetch_started)
+
+
+def _take_prefetched_index(session_id: str) -> Optional[FarmerProductIndex]:
+    """
+    Consume the session's prefetch, waiting for it if still in flight.
+    Returns None when there is no prefetch or it failed (caller fetches itself).
+    Auth failures are re-raised so the caller reports them as usual.
+    """
+    global _prefetch_wait_seconds
+    session = get_session(session_id)
+    future, session.prefetch = session.prefetch, None
+    if future is None:
+        return None
+    
+    started = time.monotonic()
+    try:
+        index = future.result(timeout=REQUEST_TIMEOUT)
+    except ProductServiceAuthError:
+        _record_prefetch(session, future)
+        _count_prefetch("hits", session.prefetch_label)
+        raise
+    except Exception as e:
+        _record_prefetch(session, future)
+        logger.warning(f"Product prefetch failed, fetching directly: {e}")
+        _count_prefetch("errors", session.prefetch_label)
+        return None
+    _record_prefetch(session, future)
+    
+    with _prefetch_lock:
+        _prefetch_wait_seconds += time.monotonic() - started
+    _count_prefetch("hits", session.prefetch_label)
+    return index
+
+
+def finish_products_prefetch(session_id: str):
+    """End-of-turn bookkeeping: a prefetch no tool consumed counts as waste."""
+    session = get_session(session_id)
+    future, session.prefetch = session.prefetch, None
+    if future is not None:
+        _record_prefetch(session, future)
+        _count_prefetch("waste", session.prefetch_label)
+
+
+def prefetch_stats() -> Dict[str, Any]:
+    """Prefetch hit/waste counters, overall and per label."""
+    with _prefetch_lock:
+        totals = {kind: sum(counts.values()) for kind, counts in _prefetch_counts.items()}
+        return {
+            "enabled": PREFETCH_PRODUCTS,
+            **totals,
+            "hit_rate": round(totals["hits"] / totals["started"], 3) if totals["started"] else 0.0,
+            "hit_wait_ms_total": round(_prefetch_wait_seconds * 1000, 1),
+            "by_label": {kind: dict(counts) for kind, counts in _prefetch_counts.items()},
+        }
+
+
+# Product vocabulary (English and Tamil) used for categorization and turn routing
+CATEGORY_KEYWORDS: Dict[str, List[str]] = {
+    "Vegetables": [
+        "tomato", "onion", "potato", "carrot", "brinjal", "cabbage", "cauliflower",
+        "beans", "peas", "spinach", "ladyfinger", "okra", "drumstick", "bitter gourd",
+        "bottle gourd", "cucumber", "radish", "beetroot", "green chilli", "capsicum",
+        "தக்காளி", "வெங்காயம்", "உருளைக்கிழங்கு", "கேரட்", "கத்திரிக்காய்"
+    ],
+    "Fruits": [
+        "mango", "banana", "apple", "orange", "grapes", "papaya", "guava", "pomegranate",
+        "watermelon", "pineapple", "coconut", "lemon", "lime", "jackfruit",
+        "மாம்பழம்", "வாழைப்பழம்", "ஆப்பிள்", "ஆரஞ்சு", "திராட்சை"
+    ],
+    "Grains": [
+        "rice", "wheat", "maize", "corn", "millet", "barley", "oats", "ragi",
+        "jowar", "bajra", "quinoa",
+        "அரிசி", "கோதுமை", "சோளம்", "கேழ்வரகு"
+    ],
+    "Pulses": [
+        "dal", "lentil", "chickpea", "chana", "moong", "urad", "toor", "masoor",
+        "rajma", "kidney bean", "black gram", "green gram",
+        "பருப்பு", "கடலை"
+    ],
+    "Dairy": [
+        "milk", "curd", "yogurt", "butter", "ghee", "cheese", "paneer", "cream"
+    ],
+    "Spices": [
+        "turmeric", "chilli", "pepper", "cardamom", "cinnamon", "clove", "cumin",
+        "coriander", "mustard", "fenugreek", "ginger", "garlic",
+        "மஞ்சள்", "மிளகு", "இஞ்சி", "பூண்டு"
+    ],
+    "Oils": [
+        "groundnut oil", "coconut oil", "sesame oil", "mustard oil", "sunflower oil",
+        "olive oil", "palm oil",
+        "நல்லெண்ணெய்", "தேங்காய் எண்ணெய்"
+    ]
+}
+
+
+# Current session ID (set by agent before each call).
+# A ContextVar keeps concurrent chat turns from seeing each other's session.
+_current_session_id: ContextVar[str] = ContextVar("current_session_id", default="default")
+
+
+def set_current_session(session_id: str):
+    """Bind the session used by the tools (and stamped on log records) for the current request/task."""
+    _current_session_id.set(session_id)
+    bind_session_id(session_id)
+
+
+def current_session_id() -> str:
+    """Session ID bound to the current request/task."""
+    return _current_session_id.get()
 
 
 def get_farmer_products() -> str:
@@ -112,46 +428,50 @@ def get_farmer_products() -> str:
     Returns:
         A summary of the farmer's existing products.
     """
-    session = get_session(CURRENT_SESSION_ID)
-    logger.debug(f"get_farmer_products called for session {CURRENT_SESSION_ID[:8]}...")
+    session_id = current_session_id()
+    session = get_session(session_id)
+    logger.debug("get_farmer_products called for session %s...", session_id[:8])
     
     if not session.auth_token:
         return "Error: No authentication token. Please login first."
     
     try:
-        url = f"{PRODUCT_SERVICE_URL}/my-products"
-        headers = _get_headers(CURRENT_SESSION_ID)
-        
-        response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
-        
-        logger.debug(f"Response status: {response.status_code}")
-        
-        if response.status_code == 401:
-            return "Error: Authentication failed. Please login again."
-        
-        response.raise_for_status()
-        data = response.json()
-        products = data.get("products", [])
-        
-        if not products:
-            return "You have no products listed yet. You can add your first product!"
-        
-        # Format products (user-friendly, no IDs)
-        result = f"You have {len(products)} products:\n"
-        for p in products:
-            qty = p.get('currentQuantity', p.get('quantity', 0))
-            result += f"• {p.get('productName')}: {qty} units, ₹{p.get('price')}/unit\n"
-        
-        return result
-        
-    except requests.exceptions.Timeout:
-        logger.error("Request timeout in get_farmer_products")
-        return "Error: Server took too long to respond. Please try again."
+        index = _take_prefetched_index(session_id) or _refresh_product_index(session_id)
+        products = list(index.products.values())
+        
+        return _format_farmer_products(products)
+        
+    except ProductServiceAuthError:
+        return "Error: Authentication failed. Please login again."
+    except (CircuitOpenError, requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+        logger.error(f"Product service unreachable in get_farmer_products: {e}")
+        # Serve the last known listings, clearly flagged as possibly outdated
+        index = get_cached_index(session_id, allow_stale=True)
+        if index is not None:
+            minutes = max(1, int(index.age() // 60))
+            return _format_farmer_products(list(index.products.values())) + \
+                f"(⚠️ Saved data from about {minutes} min ago - the product service is not reachable right now, so this may be out of date.)"
+        if isinstance(e, requests.exceptions.Timeout):
+            return "Error: Server took too long to respond. Please try again."
+        return SERVICE_UNAVAILABLE_MESSAGE
     except requests.exceptions.RequestException as e:
         logger.error(f"Request error: {str(e)}")
         return f"Error fetching products: {str(e)}"
 
 
+def _format_farmer_products(products: List[dict]) -> str:
+    """Format the farmer's listings for the model (user-friendly, no IDs)."""
+    if not products:
+        return "You have no products listed yet. You can add your first product!"
+    
+    result = f"You have {len(products)} products:\n"
+    for p in products:
+        qty = p.get('currentQuantity', p.get('quantity', 0))
+        result += f"• {p.get('productName')}: {qty} units, ₹{p.get('price')}/unit\n"
+    
+    return result
+
+
 def create_product(
     product_name: str,
     quantity: int,
@@ -172,12 +492,17 @@ def create_product(
     Returns:
         Success or error message.
     """
-    session = get_session(CURRENT_SESSION_ID)
-    logger.debug(f"create_product called: {product_name}, qty={quantity}, price={price}")
+    session_id = current_session_id()
+    session = get_session(session_id)
+    logger.debug("create_product called: %s, qty=%s, price=%s", product_name, quantity, price)
     
     if not session.auth_token:
         return "Error: No authentication token. Please login first."
     
+    # Writes fail fast while the product service is down
+    if _product_service_down():
+        return SERVICE_UNAVAILABLE_MESSAGE
+    
     # Input validation
     if not product_name or not product_name.strip():
         return "Error: Product name cannot be empty."
@@ -197,7 +522,7 @@ def create_product(
         category = "Others"
     
     # Check for pending image (from image upload)
-    pending_image = get_and_clear_pending_image(CURRENT_SESSION_ID)
+    pending_image, renditions = _take_pending_image(session_id)
     image_url = None
     if pending_image:
         image_url = f"data:image/jpeg;base64,{pending_image}"
@@ -214,16 +539,19 @@ def create_product(
     # Add image if available
     if image_url:
         payload["image"] = image_url
+        if renditions:
+            payload["imageRenditions"] = renditions
     
     try:
-        response = requests.post(
+        response = _product_request(
+            "POST",
             PRODUCT_SERVICE_URL,
             json=payload,
-            headers=_get_headers(CURRENT_SESSION_ID),
+            headers=_get_headers(session_id),
             timeout=REQUEST_TIMEOUT
         )
         
-        logger.debug(f"Response status: {response.status_code}")
+        logger.debug("Response status: %s", response.status_code)
         
         if response.status_code == 401:
             return "Error: Authentication failed. Please login again."
@@ -235,11 +563,16 @@ def create_product(
         data = response.json()
         
         if data.get("success"):
+            index = get_cached_index(session_id)
+            if index and data.get("product"):
+                index.add(data["product"])
             image_note = " with your uploaded image" if image_url else ""
             return f"✅ Successfully created {product_name}{image_note}! Quantity: {qty_int} units, Price: ₹{price_int}/unit"
         else:
             return f"Failed to create product: {data.get('message', 'Unknown error')}"
             
+    except (CircuitOpenError, ProductServiceUnreachable):
+        return SERVICE_UNAVAILABLE_MESSAGE
     except requests.exceptions.Timeout:
         logger.error("Request timeout in create_product")
         return "Error: Server took too long to respond. Please try again."
@@ -260,50 +593,50 @@ def update_product_quantity(product_name: str, quantity_to_add: int) -> str:
     Returns:
         Success or error message.
     """
-    session = get_session(CURRENT_SESSION_ID)
-    logger.debug(f"update_product_quantity called: {product_name}, add={quantity_to_add}")
+    session_id = current_session_id()
+    session = get_session(session_id)
+    logger.debug("update_product_quantity called: %s, add=%s", product_name, quantity_to_add)
     
     if not session.auth_token:
         return "Error: No authentication token. Please login first."
     
+    # Writes fail fast while the product service is down
+    if _product_service_down():
+        return SERVICE_UNAVAILABLE_MESSAGE
+    
     # Input validation
     valid, error, qty_int = _validate_positive_int(quantity_to_add, "Quantity to add", 100000)
     if not valid:
         return error
     
     try:
-        # Find product by name first
-        response = requests.get(
-            f"{PRODUCT_SERVICE_URL}/my-products",
-            headers=_get_headers(CURRENT_SESSION_ID),
-            timeout=REQUEST_TIMEOUT
-        )
-        
-        if response.status_code == 401:
-            return "Error: Authentication failed. Please login again."
-        
-        response.raise_for_status()
-        products = response.json().get("products", [])
-        
-        # Find matching product (case-insensitive)
-        matching = None
-        for p in products:
-            if p.get("productName", "").lower() == product_name.lower():
-                matching = p
-                break
-        
+        # Resolve the product from the farmer's name index
+        matching, error = _resolve_product(session_id, product_name)
         if not matching:
-            return f"Could not find product '{product_name}' in your listings."
+            return error
         
         product_id = matching.get("_id")
-        current_qty = matching.get("currentQuantity", matching.get("quantity", 0))
+        product_name = matching.get("productName", product_name)
+        
+        # Re-read the live quantity: orders lower it between index refreshes
+        product_response = _product_request(
+            "GET",
+            f"{PRODUCT_SERVICE_URL}/{product_id}",
+            params={"view": "summary"},
+            headers=_get_headers(session_id),
+            timeout=REQUEST_TIMEOUT
+        )
+        product_response.raise_for_status()
+        current = product_response.json().get("product", matching)
+        current_qty = current.get("currentQuantity", current.get("quantity", 0))
         new_qty = current_qty + qty_int
         
         # Update
-        update_response = requests.put(
+        update_response = _product_request(
+            "PUT",
             f"{PRODUCT_SERVICE_URL}/{product_id}",
             json={"quantity": new_qty},
-            headers=_get_headers(CURRENT_SESSION_ID),
+            headers=_get_headers(session_id),
             timeout=REQUEST_TIMEOUT
         )
         
@@ -315,8 +648,16 @@ def update_product_quantity(product_name: str, quantity_to_add: int) -> str:
         
         update_response.raise_for_status()
         
+        index = get_cached_index(session_id)
+        if index:
+            index.set_field(product_id, "currentQuantity", new_qty)
+        
         return f"✅ Updated {product_name}! Added {qty_int} units. New total: {new_qty} units."
         
+    except (CircuitOpenError, ProductServiceUnreachable):
+        return SERVICE_UNAVAILABLE_MESSAGE
+    except ProductServiceAuthError:
+        return "Error: Authentication failed. Please login again."
     except requests.exceptions.Timeout:
         return "Error: Server took too long to respond. Please try again."
     except requests.exceptions.RequestException as e:
@@ -337,11 +678,22 @@ def search_products(query: str) -> str:
     if not query or not query.strip():
         return "Error: Search query cannot be empty."
     
+    # Serve from the in-memory marketplace index while it is fresh enough
+    if SEARCH_INDEX_ENABLED:
+        marketplace_index.start()
+        if marketplace_index.is_fresh():
+            marketplace_index.record_search(served_from_index=True)
+            total, products = marketplace_index.search(query.strip())
+            return _format_search_results(query, total, products)
+        marketplace_index.record_search(served_from_index=False)
+    
+    session_id = current_session_id()
     try:
-        response = requests.get(
+        response = _product_request(
+            "GET",
             PRODUCT_SERVICE_URL,
             params={"search": query.strip()},
-            headers=_get_headers(CURRENT_SESSION_ID),  # Use auth if available
+            headers=_get_headers(session_id),  # Use auth if available
             timeout=REQUEST_TIMEOUT
         )
         
@@ -349,24 +701,50 @@ def search_products(query: str) -> str:
         data = response.json()
         products = data.get("products", [])
         
-        if not products:
-            return f"No products found matching '{query}'."
-        
-        result = f"Found {len(products)} products matching '{query}':\n"
-        for p in products[:5]:
-            qty = p.get('currentQuantity', p.get('quantity', 0))
-            result += f"• {p.get('productName')} from {p.get('ownerName', 'Unknown')}: "
-            result += f"{qty} units at ₹{p.get('price')}/unit\n"
-        
-        return result
-        
-    except requests.exceptions.Timeout:
-        return "Error: Server took too long to respond. Please try again."
+        return _format_search_results(query, len(products), products[:5])
+        
+    except (CircuitOpenError, requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+        logger.error(f"Product service unreachable in search_products: {e}")
+        # Serve from the index even past its staleness bound, flagged as such
+        staleness = marketplace_index.staleness()
+        if SEARCH_INDEX_ENABLED and staleness is not None:
+            total, products = marketplace_index.search(query.strip())
+            minutes = max(1, int(staleness // 60))
+            return _format_search_results(query, total, products) + \
+                f"(⚠️ Saved marketplace data from about {minutes} min ago - prices and stock may have changed.)"
+        if isinstance(e, requests.exceptions.Timeout):
+            return "Error: Server took too long to respond. Please try again."
+        return SERVICE_UNAVAILABLE_MESSAGE
     except requests.exceptions.RequestException as e:
         logger.error(f"Request error: {str(e)}")
         return f"Error searching products: {str(e)}"
 
 
+def _format_search_results(query: str, total: int, products: List[dict]) -> str:
+    """Format search hits for the model."""
+    if not products:
+        return f"No products found matching '{query}'."
+    
+    result = f"Found {total} products matching '{query}':\n"
+    for p in products:
+        qty = p.get('currentQuantity', p.get('quantity', 0))
+        result += f"• {p.get('productName')} from {p.get('ownerName', 'Unknown')}: "
+        result += f"{qty} units at ₹{p.get('price')}/unit\n"
+    
+    return result
+
+
+def _fetch_marketplace_page(params: Dict[str, Any]) -> List[dict]:
+    """Fetch one page of public marketplace listings (used by the search index)."""
+    response = _product_request("GET", PRODUCT_SERVICE_URL, params=params)
+    response.raise_for_status()
+    return response.json().get("products", [])
+
+
+# Marketplace search index, refreshed in the background from the product service
+marketplace_index = MarketplaceIndex(_fetch_marketplace_page)
+
+
 def categorize_product(product_name: str) -> str:
     """
     Determine the appropriate category for a product based on its name.
@@ -377,46 +755,9 @@ def categorize_product(product_name: str) -> str:
     Returns:
         The category name.
     """
-    categories = {
-        "Vegetables": [
-            "tomato", "onion", "potato", "carrot", "brinjal", "cabbage", "cauliflower",
-            "beans", "peas", "spinach", "ladyfinger", "okra", "drumstick", "bitter gourd",
-            "bottle gourd", "cucumber", "radish", "beetroot", "green chilli", "capsicum",
-            "தக்காளி", "வெங்காயம்", "உருளைக்கிழங்கு", "கேரட்", "கத்திரிக்காய்"
-        ],
-        "Fruits": [
-            "mango", "banana", "apple", "orange", "grapes", "papaya", "guava", "pomegranate",
-            "watermelon", "pineapple", "coconut", "lemon", "lime", "jackfruit",
-            "மாம்பழம்", "வாழைப்பழம்", "ஆப்பிள்", "ஆரஞ்சு", "திராட்சை"
-        ],
-        "Grains": [
-            "rice", "wheat", "maize", "corn", "millet", "barley", "oats", "ragi",
-            "jowar", "bajra", "quinoa",
-            "அரிசி", "கோதுமை", "சோளம்", "கேழ்வரகு"
-        ],
-        "Pulses": [
-            "dal", "lentil", "chickpea", "chana", "moong", "urad", "toor", "masoor",
-            "rajma", "kidney bean", "black gram", "green gram",
-            "பருப்பு", "கடலை"
-        ],
-        "Dairy": [
-            "milk", "curd", "yogurt", "butter", "ghee", "cheese", "paneer", "cream"
-        ],
-        "Spices": [
-            "turmeric", "chilli", "pepper", "cardamom", "cinnamon", "clove", "cumin",
-            "coriander", "mustard", "fenugreek", "ginger", "garlic",
-            "மஞ்சள்", "மிளகு", "இஞ்சி", "பூண்டு"
-        ],
-        "Oils": [
-            "groundnut oil", "coconut oil", "sesame oil", "mustard oil", "sunflower oil",
-            "olive oil", "palm oil",
-            "நல்லெண்ணெய்", "தேங்காய் எண்ணெய்"
-        ]
-    }
-    
     product_lower = product_name.lower()
     
-    for category, keywords in categories.items():
+    for category, keywords in CATEGORY_KEYWORDS.items():
         for keyword in keywords:
             if keyword in product_lower or product_lower in keyword:
                 return category
@@ -434,50 +775,45 @@ def update_product_image(product_name: str) -> str:
     Returns:
         Success or error message.
     """
-    session = get_session(CURRENT_SESSION_ID)
-    logger.debug(f"update_product_image called: {product_name}")
+    session_id = current_session_id()
+    session = get_session(session_id)
+    logger.debug("update_product_image called: %s", product_name)
     
     if not session.auth_token:
         return "Error: No authentication token. Please login first."
     
-    # Get pending image
-    pending_img = get_and_clear_pending_image(CURRENT_SESSION_ID)
-    if not pending_img:
+    # Writes fail fast while the product service is down
+    if _product_service_down():
+        return SERVICE_UNAVAILABLE_MESSAGE
+    
+    if not _has_pending_image(session_id):
         return "No image uploaded. Please upload an image first, then ask me to update the product."
     
     try:
-        # Find product by name
-        response = requests.get(
-            f"{PRODUCT_SERVICE_URL}/my-products",
-            headers=_get_headers(CURRENT_SESSION_ID),
-            timeout=REQUEST_TIMEOUT
-        )
-        
-        if response.status_code == 401:
-            return "Error: Authentication failed. Please login again."
-        
-        response.raise_for_status()
-        products = response.json().get("products", [])
-        
-        # Find matching product (case-insensitive)
-        matching = None
-        for p in products:
-            if p.get("productName", "").lower() == product_name.lower():
-                matching = p
-                break
-        
+        # Resolve the product from the farmer's name index
+        matching, error = _resolve_product(session_id, product_name)
         if not matching:
-            return f"Could not find product '{product_name}' in your listings. Please check the name."
+            return error
         
         product_id = matching.get("_id")
+        product_name = matching.get("productName", product_name)
+        
+        # Take the pending image only once the product is known
+        pending_img, renditions = _take_pending_image(session_id)
+        if not pending_img:
+            return "No image uploaded. Please upload an image first, then ask me to update the product."
         
         # Update with image
         image_url = f"data:image/jpeg;base64,{pending_img}"
+        payload = {"image": image_url}
+        if renditions:
+            payload["imageRenditions"] = renditions
         
-        update_response = requests.put(
+        update_response = _product_request(
+            "PUT",
             f"{PRODUCT_SERVICE_URL}/{product_id}",
-            json={"image": image_url},
-            headers=_get_headers(CURRENT_SESSION_ID),
+            json=payload,
+            headers=_get_headers(session_id),
             timeout=REQUEST_TIMEOUT
         )
         
@@ -492,8 +828,129 @@ def update_product_image(product_name: str) -> str:
         logger.info(f"Image updated successfully for {product_name}")
         return f"✅ Successfully updated image for {product_name}!"
         
+    except (CircuitOpenError, ProductServiceUnreachable):
+        return SERVICE_UNAVAILABLE_MESSAGE
+    except ProductServiceAuthError:
+        return "Error: Authentication failed. Please login again."
     except requests.exceptions.Timeout:
         return "Error: Server took too long to respond. Please try again."
     except requests.exceptions.RequestException as e:
         logger.error(f"Request error: {str(e)}")
         return f"Error updating product image: {str(e)}"
+
+
+def validate_tool_call(function_name: str, function_args: Any) -> str:
+    """
+    Check a model-proposed tool call without executing it.
+    Applies the same argument rules the tools enforce.
+    
+    Returns:
+        Empty string when valid, otherwise the validation error.
+    """
+    function = TOOL_FUNCTIONS.get(function_name)
+    if function is None:
+        return f"Unknown tool '{function_name}'."
+    if not isinstance(function_args, dict):
+        return "Tool arguments must be an object."
+    
+    try:
+        inspect.signature(function).bind(**function_args)
+    except TypeError as e:
+        return f"Invalid arguments for {function_name}: {e}"
+    
+    if "product_name" in function_args:
+        name = function_args.get("product_name")
+        if not isinstance(name, str) or not name.strip():
+            return "Error: Product name cannot be empty."
+    
+    if function_name == "create_product":
+        valid, error, _ = _validate_positive_int(function_args.get("quantity"), "Quantity", 1000000)
+        if not valid:
+            return error
+        valid, error, _ = _validate_positive_int(function_args.get("price"), "Price", 100000)
+        if not valid:
+            return error
+    elif function_name == "update_product_quantity":
+        valid, error, _ = _validate_positive_int(function_args.get("quantity_to_add"), "Quantity to add", 100000)
+        if not valid:
+            return error
+    elif function_name == "search_products":
+        query = function_args.get("query")
+        if not isinstance(query, str) or not query.strip():
+            return "Error: Search query cannot be empty."
+    
+    return ""
+
+
+# Tools the agent may call, by name
+TOOL_FUNCTIONS = {
+    "get_farmer_products": get_farmer_products,
+    "create_product": create_product,
+    "update_product_quantity": update_product_quantity,
+    "search_products": search_products,
+    "categorize_product": categorize_product,
+    "update_product_image": update_product_image,
+}
+
+
+# --- Background jobs ---------------------------------------------------------
+
+# Slow write tools that async-mode turns hand to the job queue
+BACKGROUND_TOOLS = {"create_product", "update_product_quantity", "update_product_image"}
+_IMAGE_TOOLS = {"create_product", "update_product_image"}
+
+job_queue = JobQueue()
+
+
+def _is_transient_failure(result: Any) -> bool:
+    """Retry only when the write never reached the product service (circuit open or no connection)."""
+    return result == SERVICE_UNAVAILABLE_MESSAGE
+
+
+def _retry_after(result: Any) -> float:
+    """Wait out an open circuit: an earlier retry would be refused again."""
+    return product_breaker.retry_after() if result == SERVICE_UNAVAILABLE_MESSAGE else 0.0
+
+
+def _is_success(result: Any) -> bool:
+    return isinstance(result, str) and result.startswith("✅")
+
+
+def queue_tool_call(function_name: str, function_args: Dict[str, Any], owner: str) -> Job:
+    """
+    Run a write tool on the background job queue instead of inline.
+    
+    The job takes ownership of the session's pending image and hands it to
+    each attempt directly, so a retry still has the image to upload and a
+    failed job never leaves it behind for a later write.
+    
+    Args:
+        function_name: One of BACKGROUND_TOOLS
+        function_args: Validated tool arguments
+        owner: Session key allowed to poll the job
+    """
+    session_id = current_session_id()
+    session = get_session(session_id)
+    image, renditions = None, {}
+    if function_name in _IMAGE_TOOLS:
+        image, renditions = session.pending_image, session.pending_renditions
+        session.pending_image, session.pending_renditions = None, {}
+    func = TOOL_FUNCTIONS[function_name]
+    
+    def attempt():
+        if function_name not in _IMAGE_TOOLS:
+            return func(**function_args)
+        token = _job_image.set((image, renditions))
+        try:
+            return func(**function_args)
+        finally:
+            _job_image.reset(token)
+    
+    return job_queue.submit(
+        function_name,
+        attempt,
+        owner=owner,
+        retry_if=_is_transient_failure,
+        retry_after=_retry_after,
+        succeeded_if=_is_success
+    )
@@ -0,0 +1,210 @@
+"""
+Admission control for the AI service.
+Caps concurrent chat turns, rate limits each session with a token bucket and
+keeps a bounded wait queue so overload turns into fast 429s instead of timeouts.
+"""
+
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+MAX_IN_FLIGHT = int(os.getenv("AI_MAX_IN_FLIGHT", "8"))
+MAX_QUEUE = int(os.getenv("AI_MAX_QUEUE", "32"))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("AI_QUEUE_TIMEOUT", "15"))
+RATE_PER_MINUTE = float(os.getenv("AI_RATE_PER_MINUTE", "20"))
+RATE_BURST = int(os.getenv("AI_RATE_BURST", "5"))
+MAX_TRACKED_SESSIONS = 10000
+WAIT_SAMPLE_WINDOW = 512
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed or rate limited."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class TokenBucket:
+    """Per-session token bucket."""
+    capacity: float
+    refill_per_second: float
+    tokens: float = 0.0
+    updated_at: float = field(default_factory=time.monotonic)
+
+    def take(self, now: float) -> float:
+        """
+        Try to take one token.
+        Returns 0 on success, otherwise the seconds until a token is available.
+        """
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        if self.refill_per_second <= 0:
+            return 60.0
+        return (1 - self.tokens) / self.refill_per_second
+
+
+class AdmissionController:
+    """
+    Global in-flight cap plus per-session rate limit with a bounded FIFO queue.
+    All state is touched from the event loop only, so no locks are needed.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        max_queue: int = MAX_QUEUE,
+        queue_timeout: float = QUEUE_TIMEOUT_SECONDS,
+        rate_per_minute: float = RATE_PER_MINUTE,
+        burst: int = RATE_BURST,
+    ):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.rate_per_second = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+
+        self._in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+        # Metrics
+        self._admitted = 0
+        self._rate_limited = 0
+        self._shed_queue_full = 0
+        self._shed_queue_timeout = 0
+        self._queued = 0
+        self._wait_samples: Deque[float] = deque(maxlen=WAIT_SAMPLE_WINDOW)
+        self._service_samples: Deque[float] = deque(maxlen=WAIT_SAMPLE_WINDOW)
+
+    def _check_rate(self, key: str) -> float:
+        """Apply the per-session token bucket. Returns seconds to wait (0 = allowed)."""
+        if self.rate_per_second <= 0:
+            return 0.0  # Rate limiting disabled
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(capacity=self.burst, refill_per_second=self.rate_per_second, tokens=self.burst)
+            self._buckets[key] = bucket
+            if len(self._buckets) > MAX_TRACKED_SESSIONS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.take(time.monotonic())
+
+    def _estimated_retry_after(self) -> int:
+        """Estimate when a slot frees up from recent service times."""
+        if not self._service_samples:
+            return 1
+        avg = sum(self._service_samples) / len(self._service_samples)
+        backlog = (len(self._waiters) + self._in_flight) / self.max_in_flight
+        return max(1, math.ceil(avg * backlog))
+
+    async def acquire(self, key: str) -> float:
+        """
+        Wait for an execution slot.
+        Returns the time spent queued; raises AdmissionRejected when shed.
+        """
+        wait = self._check_rate(key)
+        if wait > 0:
+            self._rate_limited += 1
+            raise AdmissionRejected("Too many messages, please slow down.", max(1, math.ceil(wait)))
+
+        if self._in_flight < self.max_in_flight and not self._waiters:
+            self._in_flight += 1
+            self._admitted += 1
+            self._wait_samples.append(0.0)
+            return 0.0
+
+        if len(self._waiters) >= self.max_queue:
+            self._shed_queue_full += 1
+            raise AdmissionRejected("Service is busy, please try again shortly.", self._estimated_retry_after())
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        self._queued += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot was handed over just as we timed out - give it back.
+                self.release(0.0)
+            else:
+                waiter.cancel()
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            self._shed_queue_timeout += 1
+            raise AdmissionRejected("Service is busy, please try again shortly.", self._estimated_retry_after())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(0.0)
+            else:
+                waiter.cancel()
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            raise
+
+        waited = time.monotonic() - started
+        self._admitted += 1
+        self._wait_samples.append(waited)
+        return waited
+
+    def release(self, service_seconds: Optional[float] = None):
+        """Free a slot, handing it straight to the next queued request if any."""
+        if service_seconds:
+            self._service_samples.append(service_seconds)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self._in_flight = max(0, self._in_flight - 1)
+
+    @asynccontextmanager
+    async def admit(self, key: str):
+        """Async context manager wrapping acquire/release."""
+        await self.acquire(key)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, object]:
+        """Snapshot of admission metrics."""
+        waits = sorted(self._wait_samples)
+        p95 = waits[int(len(waits) * 0.95) - 1] if len(waits) >= 20 else (waits[-1] if waits else 0.0)
+        return {
+            "in_flight": self._in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "admitted": self._admitted,
+            "queued": self._queued,
+            "rate_limited": self._rate_limited,
+            "shed_queue_full": self._shed_queue_full,
+            "shed_queue_timeout": self._shed_queue_timeout,
+            "queue_wait_avg_ms": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+            "queue_wait_p95_ms": round(p95 * 1000, 1),
+            "queue_wait_max_ms": round(waits[-1] * 1000, 1) if waits else 0.0,
+        }
@@ -0,0 +1,144 @@
+"""
+Auth helpers for the AI service.
+Decodes the platform's HS256 JWTs locally (with a small verified-token cache)
+so chat sessions can be keyed by the farmer rather than by token bytes.
+"""
+
+import os
+import re
+import hmac
+import json
+import time
+import base64
+import hashlib
+import logging
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Same secret the Node services sign tokens with
+JWT_SECRET = os.getenv("JWT_SECRET")
+TOKEN_CACHE_SIZE = int(os.getenv("AI_TOKEN_CACHE_SIZE", "1024"))
+MAX_CONVERSATION_ID_LENGTH = 64
+
+_CONVERSATION_ID_RE = re.compile(r"[^A-Za-z0-9_-]")
+
+
+class InvalidTokenError(Exception):
+    """Token is malformed, has a bad signature or has expired."""
+
+
+def _b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def decode_token(token: str, secret: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Verify an HS256 JWT and return its claims.
+
+    Raises:
+        InvalidTokenError: if the token cannot be trusted
+    """
+    secret = secret if secret is not None else JWT_SECRET
+    if not secret:
+        raise InvalidTokenError("JWT_SECRET is not configured")
+
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        header = json.loads(_b64url_decode(header_b64))
+        claims = json.loads(_b64url_decode(payload_b64))
+        signature = _b64url_decode(signature_b64)
+    except (ValueError, TypeError) as e:
+        raise InvalidTokenError(f"Malformed token: {e}")
+
+    if header.get("alg") != "HS256":
+        raise InvalidTokenError(f"Unsupported algorithm: {header.get('alg')}")
+
+    expected = hmac.new(secret.encode("utf-8"), f"{header_b64}.{payload_b64}".encode("ascii"), hashlib.sha256).digest()
+    if not hmac.compare_digest(signature, expected):
+        raise InvalidTokenError("Bad signature")
+
+    exp = claims.get("exp")
+    if exp is not None and time.time() >= float(exp):
+        raise InvalidTokenError("Token expired")
+
+    return claims
+
+
+# Verified-token cache: token -> (subject, exp)
+_verified: "OrderedDict[str, Tuple[str, Optional[float]]]" = OrderedDict()
+_verified_lock = Lock()
+
+
+def token_subject(token: str) -> str:
+    """
+    Return the user ID a token was issued for.
+    Signature checks are cached, so repeat turns skip the HMAC.
+
+    Raises:
+        InvalidTokenError: if the token cannot be trusted
+    """
+    with _verified_lock:
+        cached = _verified.get(token)
+        if cached:
+            _verified.move_to_end(token)
+    if cached:
+        subject, exp = cached
+        if exp is None or time.time() < exp:
+            return subject
+        with _verified_lock:
+            _verified.pop(token, None)
+        raise InvalidTokenError("Token expired")
+
+    claims = decode_token(token)
+    subject = claims.get("id") or claims.get("sub")
+    if not subject:
+        raise InvalidTokenError("Token has no subject")
+
+    exp = claims.get("exp")
+    with _verified_lock:
+        _verified[token] = (str(subject), float(exp) if exp is not None else None)
+        if len(_verified) > TOKEN_CACHE_SIZE:
+            _verified.popitem(last=False)
+    return str(subject)
+
+
+def rate_limit_key(token: Optional[str], client_host: Optional[str]) -> str:
+    """
+    Key for per-farmer rate limiting: "user:<id>" for a verified token, else
+    the client IP. Unverifiable tokens cost nothing to make up, so they must
+    not get a bucket of their own (unlike session_id_for, which hashes them).
+    """
+    if token:
+        try:
+            return f"user:{token_subject(token)}"
+        except InvalidTokenError:
+            pass
+    return f"ip:{client_host or 'unknown'}"
+
+
+def session_id_for(token: Optional[str], conversation_id: Optional[str] = None) -> str:
+    """
+    Session key for a chat turn.
+
+    Verified tokens map to "user:<id>" so each farmer gets one history however
+    often their token is refreshed. Tokens that cannot be verified are keyed by
+    their full hash, never by a prefix. An optional conversation ID splits one
+    farmer's chats into separate histories.
+    """
+    if not token:
+        base = "anonymous"
+    else:
+        try:
+            base = f"user:{token_subject(token)}"
+        except InvalidTokenError as e:
+            logger.debug("Token not verified locally (%s), keying session by token hash", e)
+            base = "token:" + hashlib.sha256(token.encode("utf-8")).hexdigest()[:32]
+
+    if conversation_id:
+        conversation_id = _CONVERSATION_ID_RE.sub("", conversation_id)[:MAX_CONVERSATION_ID_LENGTH]
+        if conversation_id:
+            return f"{base}:{conversation_id}"
+    return base
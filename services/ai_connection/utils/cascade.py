@@ -0,0 +1,127 @@
+"""
+Fast/slow model cascade.
+Classifies each chat turn so simple confirmations and single-tool turns go to
+a small fast model, while multi-product, ambiguous or mixed-language turns go
+to the large model. Routing decisions and per-tier latency are recorded.
+"""
+
+import re
+import logging
+from collections import Counter
+from threading import Lock
+from typing import Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+TIER_FAST = "fast"
+TIER_LARGE = "large"
+
+# Short replies that only confirm/deny the previous bot message
+CONFIRMATION_WORDS = {
+    "yes", "yeah", "yep", "ok", "okay", "correct", "right", "sure", "confirm", "done",
+    "no", "nope", "cancel", "wrong", "fine", "good", "thanks", "thank", "you", "please",
+    "ஆம்", "ஆமா", "சரி", "ஓகே", "இல்லை", "வேண்டாம்", "நன்றி",
+}
+
+MAX_SIMPLE_WORDS = 12
+MAX_SIMPLE_NUMBERS = 2
+MAX_SIMPLE_CHARS = 120
+
+_TAMIL_RE = re.compile(r"[\u0B80-\u0BFF]")
+_LATIN_RE = re.compile(r"[A-Za-z]")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+_WORD_RE = re.compile(r"[\w\u0B80-\u0BFF]+")
+_CONJUNCTION_RE = re.compile(r"\b(and|also|plus|then)\b|,|;|மற்றும்|அப்புறம்")
+
+
+def _mentions(text: str, keyword: str) -> bool:
+    """Whole-word match for English names (allowing plurals); substring for Tamil."""
+    if _TAMIL_RE.search(keyword):
+        return keyword in text
+    return re.search(rf"\b{re.escape(keyword)}(?:s|es)?\b", text) is not None
+
+
+def classify_turn(text: str, product_keywords: Iterable[str]) -> Tuple[str, str]:
+    """
+    Decide which model tier should handle a turn.
+
+    Args:
+        text: The farmer's message
+        product_keywords: Known product names (English and Tamil)
+
+    Returns:
+        Tuple of (tier, reason)
+    """
+    stripped = (text or "").strip()
+    lowered = stripped.lower()
+    if not stripped:
+        return TIER_LARGE, "empty"
+
+    if "[image attached" in lowered:
+        return TIER_LARGE, "image"
+
+    if _TAMIL_RE.search(stripped) and _LATIN_RE.search(stripped):
+        return TIER_LARGE, "mixed_language"
+
+    words = _WORD_RE.findall(lowered)
+    if words and all(word in CONFIRMATION_WORDS for word in words) and len(words) <= 4:
+        return TIER_FAST, "confirmation"
+
+    if len(stripped) > MAX_SIMPLE_CHARS or len(words) > MAX_SIMPLE_WORDS:
+        return TIER_LARGE, "long"
+
+    products = {keyword for keyword in product_keywords if _mentions(lowered, keyword)}
+    # "green chilli" also matches "chilli" - count only the longest matches
+    products = {p for p in products if not any(p != other and p in other for other in products)}
+    if len(products) > 1 or _CONJUNCTION_RE.search(lowered):
+        return TIER_LARGE, "multi_product"
+
+    if len(_NUMBER_RE.findall(lowered)) > MAX_SIMPLE_NUMBERS:
+        return TIER_LARGE, "many_numbers"
+
+    if len(products) == 1:
+        return TIER_FAST, "single_product"
+
+    return TIER_LARGE, "ambiguous"
+
+
+class CascadeStats:
+    """Thread-safe counters for routing decisions and the latency split."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._turns: Counter = Counter()
+        self._reasons: Counter = Counter()
+        self._escalations: Counter = Counter()
+        self._latency: Dict[str, List[float]] = {TIER_FAST: [0.0, 0], TIER_LARGE: [0.0, 0]}
+
+    def record_decision(self, tier: str, reason: str):
+        with self._lock:
+            self._turns[tier] += 1
+            self._reasons[reason] += 1
+
+    def record_escalation(self, reason: str):
+        with self._lock:
+            self._escalations[reason] += 1
+
+    def record_latency(self, tier: str, seconds: float):
+        with self._lock:
+            total = self._latency.setdefault(tier, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "turns": dict(self._turns),
+                "reasons": dict(self._reasons),
+                "escalations": dict(self._escalations),
+                "llm_latency": {
+                    tier: {
+                        "calls": count,
+                        "total_ms": round(total * 1000, 1),
+                        "avg_ms": round(total / count * 1000, 1) if count else 0.0,
+                    }
+                    for tier, (total, count) in self._latency.items()
+                },
+            }
@@ -0,0 +1,182 @@
+"""
+Circuit breaker for calls to downstream services.
+Trips open when the recent failure rate or slow-call rate crosses a
+threshold, fails fast while open, and lets a few probe calls through
+(half-open) before closing again.
+"""
+
+import os
+import time
+import logging
+from collections import deque
+from threading import Lock
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+FAILURE_RATE_THRESHOLD = float(os.getenv("AI_BREAKER_FAILURE_RATE", "0.5"))
+SLOW_CALL_SECONDS = int(os.getenv("AI_BREAKER_SLOW_CALL_MS", "3000")) / 1000.0
+SLOW_CALL_RATE_THRESHOLD = float(os.getenv("AI_BREAKER_SLOW_CALL_RATE", "0.8"))
+WINDOW_SIZE = int(os.getenv("AI_BREAKER_WINDOW", "20"))
+MIN_CALLS = int(os.getenv("AI_BREAKER_MIN_CALLS", "5"))
+OPEN_SECONDS = float(os.getenv("AI_BREAKER_OPEN_SECONDS", "30"))
+HALF_OPEN_MAX_CALLS = int(os.getenv("AI_BREAKER_HALF_OPEN_CALLS", "2"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Count-based sliding-window circuit breaker (thread-safe).
+
+    A call is a failure if it raises or if `is_failure(result)` is true, and
+    slow if it takes longer than `slow_call_seconds`. Once the window holds at
+    least `min_calls` outcomes, either rate crossing its threshold opens the
+    circuit for `open_seconds`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = FAILURE_RATE_THRESHOLD,
+        slow_call_seconds: float = SLOW_CALL_SECONDS,
+        slow_call_rate_threshold: float = SLOW_CALL_RATE_THRESHOLD,
+        window_size: int = WINDOW_SIZE,
+        min_calls: int = MIN_CALLS,
+        open_seconds: float = OPEN_SECONDS,
+        half_open_max_calls: int = HALF_OPEN_MAX_CALLS,
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = max(1, half_open_max_calls)
+
+        self._lock = Lock()
+        self._state = CLOSED
+        self._window: Deque[Tuple[bool, bool]] = deque(maxlen=window_size)  # (failed, slow)
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+        self._stats = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._half_open_in_flight = 0
+            self._half_open_successes = 0
+            logger.info(f"Circuit {self.name}: half-open, probing")
+
+    def _open_remaining(self) -> float:
+        return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def retry_after(self) -> float:
+        """Seconds until an open circuit lets probe calls through (0 unless open)."""
+        with self._lock:
+            self._maybe_half_open()
+            return self._open_remaining() if self._state == OPEN else 0.0
+
+    def _open(self, reason: str):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._window.clear()
+        self._stats["opened"] += 1
+        logger.warning(f"Circuit {self.name}: OPEN ({reason})")
+
+    def _acquire(self):
+        """Admit a call or raise CircuitOpenError."""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == OPEN:
+                self._stats["rejected"] += 1
+                raise CircuitOpenError(self.name, self._open_remaining())
+            if self._state == HALF_OPEN:
+                if self._half_open_in_flight >= self.half_open_max_calls:
+                    self._stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, 1)
+                self._half_open_in_flight += 1
+
+    def _record(self, failed: bool, duration: float):
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["failures"] += int(failed)
+            self._stats["slow_calls"] += int(slow)
+
+            if self._state == HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                if failed or slow:
+                    self._open("probe failed" if failed else "probe slow")
+                    return
+                self._half_open_successes += 1
+                if self._half_open_successes >= self.half_open_max_calls:
+                    self._state = CLOSED
+                    self._window.clear()
+                    logger.info(f"Circuit {self.name}: closed")
+                return
+
+            if self._state != CLOSED:
+                return  # Late result from a call admitted before the circuit opened
+
+            self._window.append((failed, slow))
+            if len(self._window) < self.min_calls:
+                return
+            failure_rate = sum(f for f, _ in self._window) / len(self._window)
+            slow_rate = sum(s for _, s in self._window) / len(self._window)
+            if failure_rate >= self.failure_rate_threshold:
+                self._open(f"failure rate {failure_rate:.0%}")
+            elif slow_rate >= self.slow_call_rate_threshold:
+                self._open(f"slow-call rate {slow_rate:.0%}")
+
+    def call(self, func: Callable, *args, is_failure: Optional[Callable[[Any], bool]] = None, **kwargs):
+        """
+        Run `func` through the breaker.
+
+        Raises:
+            CircuitOpenError: if the circuit is open (func is not called)
+        """
+        self._acquire()
+        started = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self._record(True, time.monotonic() - started)
+            raise
+        self._record(bool(is_failure and is_failure(result)), time.monotonic() - started)
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        """State and counters for health checks."""
+        with self._lock:
+            self._maybe_half_open()
+            window = list(self._window)
+            snapshot = {
+                "state": self._state,
+                "window_calls": len(window),
+                "failure_rate": round(sum(f for f, _ in window) / len(window), 3) if window else 0.0,
+                "slow_call_rate": round(sum(s for _, s in window) / len(window), 3) if window else 0.0,
+                **self._stats,
+            }
+            if self._state == OPEN:
+                snapshot["retry_in_seconds"] = round(self._open_remaining(), 1)
+            return snapshot
@@ -1,13 +1,16 @@
 """
 Image utilities for AI service.
-Handles image compression and format conversion.
+Handles image compression, format conversion and multi-size renditions.
 """
 
 import io
+import os
 import base64
 import logging
-from PIL import Image
-from typing import Tuple
+from PIL import Image, ImageOps
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+from utils.tracing import start_span
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +18,69 @@ logger = logging.getLogger(__name__)
 MAX_IMAGE_SIZE_BYTES = 2 * 1024 * 1024  # 2MB
 MIN_QUALITY = 10
 MAX_DIMENSION = 1920  # Max width/height
+RENDITION_QUALITY = 80
+FULL_RENDITION = "full"  # The rendition attached as the product image
+
+
+def _parse_renditions(spec: str) -> List[Tuple[str, int]]:
+    """
+    Parse "thumbnail:200,card:600,full:1920" into [(name, max_dimension), ...].
+    
+    Raises:
+        ValueError: If an entry is malformed or there is no "full" rendition
+    """
+    renditions = []
+    for item in spec.split(","):
+        name, _, size = item.strip().partition(":")
+        if not name or not size.isdigit() or int(size) == 0:
+            raise ValueError(f"Invalid AI_IMAGE_RENDITIONS entry '{item.strip()}', expected name:max_dimension")
+        renditions.append((name, int(size)))
+    if FULL_RENDITION not in (name for name, _ in renditions):
+        raise ValueError(f"AI_IMAGE_RENDITIONS must include a '{FULL_RENDITION}' rendition (got '{spec}')")
+    return renditions
+
+
+# Renditions generated at upload time.
+# Checked at import so a bad setting stops startup instead of failing uploads.
+RENDITION_SIZES = _parse_renditions(os.getenv("AI_IMAGE_RENDITIONS", "thumbnail:200,card:600,full:1920"))
+
+
+def _encode_jpeg(image: Image.Image, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def _encode_under_target(image: Image.Image, target_size_bytes: int) -> bytes:
+    """Encode as JPEG at the highest quality (binary search) that fits the target size."""
+    # Binary search for optimal quality
+    quality = 85
+    low, high = MIN_QUALITY, 95
+    best_result = None
+    
+    for _ in range(8):  # Max 8 iterations
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=quality, optimize=True)
+        size = buffer.tell()
+        
+        logger.debug("Quality %s: %.1fKB", quality, size / 1024)
+        
+        if size <= target_size_bytes:
+            best_result = buffer.getvalue()
+            if size > target_size_bytes * 0.8:  # Good enough (80-100% of target)
+                break
+            low = quality
+        else:
+            high = quality
+        
+        quality = (low + high) // 2
+    
+    if best_result:
+        return best_result
+    
+    # Last resort: use lowest quality
+    logger.warning(f"Used minimum quality, result may be low quality")
+    return _encode_jpeg(image, MIN_QUALITY)
 
 
 def compress_image(base64_image: str, target_size_bytes: int = MAX_IMAGE_SIZE_BYTES) -> Tuple[str, bool]:
@@ -33,7 +99,7 @@ def compress_image(base64_image: str, target_size_bytes: int = MAX_IMAGE_SIZE_BY
         image_data = base64.b64decode(base64_image)
         original_size = len(image_data)
         
-        logger.debug(f"Original image size: {original_size / 1024:.1f}KB")
+        logger.debug("Original image size: %.1fKB", original_size / 1024)
         
         # If already under target, return as-is
         if original_size <= target_size_bytes:
@@ -53,42 +119,12 @@ def compress_image(base64_image: str, target_size_bytes: int = MAX_IMAGE_SIZE_BY
             ratio = MAX_DIMENSION / max(image.size)
             new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
             image = image.resize(new_size, Image.Resampling.LANCZOS)
-            logger.debug(f"Resized from {original_dimensions} to {new_size}")
+            logger.debug("Resized from %s to %s", original_dimensions, new_size)
         
-        # Binary search for optimal quality
-        quality = 85
-        low, high = MIN_QUALITY, 95
-        best_result = None
-        
-        for _ in range(8):  # Max 8 iterations
-            buffer = io.BytesIO()
-            image.save(buffer, format='JPEG', quality=quality, optimize=True)
-            size = buffer.tell()
-            
-            logger.debug(f"Quality {quality}: {size / 1024:.1f}KB")
-            
-            if size <= target_size_bytes:
-                best_result = buffer.getvalue()
-                if size > target_size_bytes * 0.8:  # Good enough (80-100% of target)
-                    break
-                low = quality
-            else:
-                high = quality
-            
-            quality = (low + high) // 2
-        
-        if best_result:
-            compressed_base64 = base64.b64encode(best_result).decode('utf-8')
-            final_size = len(best_result)
-            logger.info(f"Compressed image: {original_size / 1024:.1f}KB -> {final_size / 1024:.1f}KB ({(1 - final_size/original_size) * 100:.1f}% reduction)")
-            return compressed_base64, True
-        
-        # Last resort: use lowest quality
-        buffer = io.BytesIO()
-        image.save(buffer, format='JPEG', quality=MIN_QUALITY, optimize=True)
-        compressed_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        logger.warning(f"Used minimum quality, result may be low quality")
-        return compressed_base64, True
+        compressed = _encode_under_target(image, target_size_bytes)
+        final_size = len(compressed)
+        logger.info(f"Compressed image: {original_size / 1024:.1f}KB -> {final_size / 1024:.1f}KB ({(1 - final_size/original_size) * 100:.1f}% reduction)")
+        return base64.b64encode(compressed).decode('utf-8'), True
         
     except Exception as e:
         logger.error(f"Image compression failed: {str(e)}")
@@ -109,3 +145,56 @@ def validate_image(base64_image: str) -> Tuple[bool, str]:
         return True, ""
     except Exception as e:
         return False, f"Invalid image: {str(e)}"
+
+
+def generate_renditions(
+    image_source: Union[bytes, BinaryIO],
+    sizes: Optional[List[Tuple[str, int]]] = None,
+    target_size_bytes: int = MAX_IMAGE_SIZE_BYTES
+) -> Dict[str, str]:
+    """
+    Generate all configured renditions from a single decode.
+    
+    Renditions are produced largest first, each downscaled from the previous
+    one. The "full" rendition is kept under `target_size_bytes`.
+    
+    Args:
+        image_source: Raw uploaded image bytes, or a seekable file (e.g. a spooled upload)
+        sizes: List of (name, max_dimension); defaults to AI_IMAGE_RENDITIONS
+        target_size_bytes: Size cap for the full rendition
+    
+    Returns:
+        Dict of rendition name -> base64 JPEG
+    """
+    sizes = sorted(sizes or RENDITION_SIZES, key=lambda item: item[1], reverse=True)
+    
+    if isinstance(image_source, (bytes, bytearray)):
+        image_source = io.BytesIO(image_source)
+    image_source.seek(0)
+    
+    with start_span("image.decode") as span:
+        image = Image.open(image_source)
+        span.set_attribute("image.format", image.format)
+        span.set_attribute("image.size", list(image.size))
+        image.draft('RGB', (sizes[0][1], sizes[0][1]))  # Let JPEG decode at reduced scale when possible
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    
+    renditions = {}
+    for name, max_dimension in sizes:
+        with start_span("image.rendition", {"image.rendition": name}) as span:
+            if max(image.size) > max_dimension:
+                image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+            
+            if name == FULL_RENDITION:
+                encoded = _encode_jpeg(image, 85)
+                if len(encoded) > target_size_bytes:
+                    encoded = _encode_under_target(image, target_size_bytes)
+            else:
+                encoded = _encode_jpeg(image, RENDITION_QUALITY)
+            
+            renditions[name] = base64.b64encode(encoded).decode('utf-8')
+            span.set_attribute("image.size", list(image.size))
+            span.set_attribute("image.bytes", len(encoded))
+        logger.debug("Rendition %s: %s, %.1fKB", name, image.size, len(encoded) / 1024)
+    
+    return renditions
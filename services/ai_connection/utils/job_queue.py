@@ -0,0 +1,226 @@
+"""
+In-process background job queue.
+Runs slow side effects (product writes, image uploads) on worker threads so
+chat requests can return before they finish. Jobs are retried with backoff,
+kept for a while for status polling, and instrumented for queue depth and
+latency.
+"""
+
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+JOB_WORKERS = int(os.getenv("AI_JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("AI_JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF_SECONDS = float(os.getenv("AI_JOB_RETRY_BACKOFF", "2"))
+JOB_HISTORY_SIZE = int(os.getenv("AI_JOB_HISTORY", "1000"))  # Finished jobs kept for polling
+LATENCY_SAMPLES = 200
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+@dataclass
+class Job:
+    """One unit of background work and its outcome."""
+    id: str
+    name: str
+    owner: str  # Session key of the farmer who queued it
+    func: Callable[[], Any] = field(repr=False)
+    retry_if: Optional[Callable[[Any], bool]] = field(default=None, repr=False)
+    retry_after: Optional[Callable[[Any], float]] = field(default=None, repr=False)
+    succeeded_if: Optional[Callable[[Any], bool]] = field(default=None, repr=False)
+    status: str = QUEUED
+    attempts: int = 0
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "attempts": self.attempts,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+class JobQueue:
+    """
+    FIFO queue drained by a small pool of daemon worker threads.
+
+    A job is retried (up to `max_attempts`, with exponential backoff) when it
+    raises or when `retry_if(result)` is true; `retry_after(result)` can ask
+    for a longer wait, e.g. until a circuit breaker lets calls through again. Jobs run in a copy of the
+    submitter's contextvars, so session-scoped tools behave as they would inline.
+    """
+
+    def __init__(
+        self,
+        workers: int = JOB_WORKERS,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        retry_backoff: float = JOB_RETRY_BACKOFF_SECONDS,
+        history_size: int = JOB_HISTORY_SIZE,
+    ):
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff = retry_backoff
+        self.history_size = history_size
+
+        self._queue: "queue.Queue[Job]" = queue.Queue()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._running = 0
+        self._stats = {"submitted": 0, "succeeded": 0, "failed": 0, "retries": 0}
+        self._wait_times: List[float] = []
+        self._run_times: List[float] = []
+
+    def _start_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(
+        self,
+        name: str,
+        func: Callable[..., Any],
+        *args,
+        owner: str = "anonymous",
+        retry_if: Optional[Callable[[Any], bool]] = None,
+        retry_after: Optional[Callable[[Any], float]] = None,
+        succeeded_if: Optional[Callable[[Any], bool]] = None,
+        **kwargs,
+    ) -> Job:
+        """Queue `func(*args, **kwargs)` and return its Job (poll with get())."""
+        context = contextvars.copy_context()
+        job = Job(
+            id=uuid.uuid4().hex,
+            name=name,
+            owner=owner,
+            func=lambda: context.run(func, *args, **kwargs),
+            retry_if=retry_if,
+            retry_after=retry_after,
+            succeeded_if=succeeded_if,
+        )
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+            self._stats["submitted"] += 1
+        self._start_workers()
+        self._queue.put(job)
+        logger.info(f"Job {job.id[:8]} queued: {name} (depth {self._queue.qsize()})")
+        return job
+
+    def _evict(self):
+        """Drop the oldest finished jobs beyond the history size."""
+        excess = len(self._jobs) - self.history_size
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished_at][:excess]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            except Exception as e:  # Never let a bad job kill the worker
+                logger.error(f"Job {job.id[:8]} crashed the worker loop: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job: Job):
+        job.started_at = time.time()
+        with self._lock:
+            self._running += 1
+            self._record(self._wait_times, job.started_at - job.created_at)
+
+        try:
+            while True:
+                job.attempts += 1
+                job.status = RUNNING
+                try:
+                    job.result = job.func()
+                    job.error = None
+                    retry = bool(job.retry_if and job.retry_if(job.result))
+                except Exception as e:
+                    job.error = str(e)
+                    retry = True
+
+                if not retry or job.attempts >= self.max_attempts:
+                    break
+                delay = self.retry_backoff * (2 ** (job.attempts - 1))
+                if job.retry_after:
+                    delay = max(delay, job.retry_after(job.result))
+                logger.warning(f"Job {job.id[:8]} ({job.name}) attempt {job.attempts} failed, retrying in {delay:.1f}s")
+                with self._lock:
+                    self._stats["retries"] += 1
+                time.sleep(delay)
+
+            succeeded = job.error is None and (job.succeeded_if is None or job.succeeded_if(job.result))
+            job.status = SUCCEEDED if succeeded else FAILED
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._running -= 1
+                self._stats["succeeded" if job.status == SUCCEEDED else "failed"] += 1
+                self._record(self._run_times, job.finished_at - job.started_at)
+        logger.info(f"Job {job.id[:8]} {job.status} after {job.attempts} attempt(s)")
+
+    @staticmethod
+    def _record(samples: List[float], seconds: float):
+        samples.append(seconds)
+        if len(samples) > LATENCY_SAMPLES:
+            del samples[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "depth": self._queue.qsize(),
+                "running": self._running,
+                "workers": self.workers,
+                "queue_wait_ms": {
+                    "p50": round(_percentile(self._wait_times, 0.5) * 1000, 1),
+                    "p95": round(_percentile(self._wait_times, 0.95) * 1000, 1),
+                },
+                "run_ms": {
+                    "p50": round(_percentile(self._run_times, 0.5) * 1000, 1),
+                    "p95": round(_percentile(self._run_times, 0.95) * 1000, 1),
+                },
+            }
@@ -0,0 +1,104 @@
+"""
+Language handling for chat turns.
+Detects Tamil vs English from the script of the message, and holds the
+per-language compact system prompts and canned replies used for turns that
+don't need the model (greetings, thanks, errors).
+"""
+
+import re
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+ENGLISH = "en"
+TAMIL = "ta"
+SUPPORTED_LANGUAGES = (ENGLISH, TAMIL)
+AUTO = "auto"
+
+# Share of letters that must be Tamil script for a message to count as Tamil
+TAMIL_SCRIPT_THRESHOLD = 0.3
+
+_TAMIL_RE = re.compile(r"[\u0B80-\u0BFF]")
+_LATIN_RE = re.compile(r"[A-Za-z]")
+_LATIN_WORD_RE = re.compile(r"[A-Za-z]+")
+_PUNCTUATION_RE = re.compile(r"[^\w\s\u0B80-\u0BFF]")
+
+
+def detect_language(text: str, default: str = ENGLISH) -> str:
+    """
+    Tamil or English, from the script the message is written in.
+
+    Messages with no letters, or a single Latin word ("ok", "yes"), are
+    ambiguous and return `default` (the conversation's language so far).
+    """
+    tamil = len(_TAMIL_RE.findall(text or ""))
+    latin = len(_LATIN_RE.findall(text or ""))
+    if tamil and tamil >= TAMIL_SCRIPT_THRESHOLD * (tamil + latin):
+        return TAMIL
+    if not latin or len(_LATIN_WORD_RE.findall(text)) <= 1:
+        return default
+    return ENGLISH
+
+
+def resolve_language(requested: Optional[str], text: str, previous: Optional[str] = None) -> str:
+    """The language for a turn: the requested one, or detected when "auto"."""
+    if requested in SUPPORTED_LANGUAGES:
+        return requested
+    return detect_language(text, default=previous or ENGLISH)
+
+
+# Compact, single-language system prompts (the bilingual one made the model
+# work out the language on every call)
+_PROMPT_BODY = """You are AgriBot, a voice assistant that helps farmers manage their product listings.
+{reply_rule}
+Confirm product, quantity and price with the farmer before creating or updating a product.
+Check existing products first (get_farmer_products). Add stock to an existing product (update_product_quantity); otherwise create it (create_product).
+Categories: Vegetables, Fruits, Grains, Pulses, Dairy, Spices, Oils, Others."""
+
+SYSTEM_PROMPTS: Dict[str, str] = {
+    ENGLISH: _PROMPT_BODY.format(reply_rule="Reply in English, in short simple sentences."),
+    TAMIL: _PROMPT_BODY.format(
+        reply_rule="Reply in Tamil script, in short simple sentences. Keep numbers and ₹ prices as digits."
+    ),
+}
+
+REPLY_TEMPLATES: Dict[str, Dict[str, str]] = {
+    ENGLISH: {
+        "greeting": "Hello! Tell me what you want to sell, for example: 50 kg tomatoes at 40 rupees.",
+        "thanks": "You're welcome! Anything else you want to add or update?",
+        "empty": "I didn't catch that. Please say it again.",
+        "error": "Sorry, there was an issue. Please try again.",
+    },
+    TAMIL: {
+        "greeting": "வணக்கம்! நீங்கள் என்ன விற்க விரும்புகிறீர்கள் என்று சொல்லுங்கள். உதாரணம்: 50 கிலோ தக்காளி 40 ரூபாய்.",
+        "thanks": "நன்றி! வேறு ஏதாவது சேர்க்க அல்லது மாற்ற வேண்டுமா?",
+        "empty": "புரியவில்லை. மீண்டும் சொல்லுங்கள்.",
+        "error": "மன்னிக்கவும், ஒரு சிக்கல் ஏற்பட்டது. மீண்டும் முயற்சிக்கவும்.",
+    },
+}
+
+# Whole messages that get a canned reply instead of a model call
+_QUICK_REPLIES = {
+    "greeting": {"hi", "hello", "hey", "hai", "hello there", "vanakkam", "வணக்கம்"},
+    "thanks": {"thanks", "thank you", "thank u", "thanks a lot", "nandri", "நன்றி", "ரொம்ப நன்றி"},
+}
+
+
+def system_prompt(language: str) -> str:
+    return SYSTEM_PROMPTS.get(language, SYSTEM_PROMPTS[ENGLISH])
+
+
+def reply_template(language: str, key: str) -> str:
+    return REPLY_TEMPLATES.get(language, REPLY_TEMPLATES[ENGLISH])[key]
+
+
+def quick_reply_kind(text: str) -> Optional[str]:
+    """"greeting", "thanks" or "empty" when the message needs no model call, else None."""
+    normalized = " ".join(_PUNCTUATION_RE.sub(" ", (text or "").lower()).split())
+    if not normalized:
+        return "empty"
+    for kind, phrases in _QUICK_REPLIES.items():
+        if normalized in phrases:
+            return kind
+    return None
@@ -0,0 +1,219 @@
+"""
+Structured, non-blocking logging for the AI service.
+Records are enqueued on the request path and formatted as JSON and written
+by a background QueueListener. Levels are set per logger from the
+environment, high-volume DEBUG call sites are sampled and rate-limited, and
+every record carries the request, session and trace IDs.
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import uuid
+import queue
+import atexit
+import random
+import logging
+import threading
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional, Tuple
+
+from utils.tracing import current_span
+
+# Configuration
+LOG_LEVEL = os.getenv("AI_LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("AI_LOG_LEVELS", "")  # e.g. "tools.product_tool=DEBUG,httpx=WARNING"
+LOG_FORMAT = os.getenv("AI_LOG_FORMAT", "json")  # json or text
+LOG_QUEUE_SIZE = int(os.getenv("AI_LOG_QUEUE_SIZE", "10000"))
+DEBUG_SAMPLE_RATE = float(os.getenv("AI_LOG_DEBUG_SAMPLE_RATE", "1.0"))
+DEBUG_RATE_PER_SECOND = float(os.getenv("AI_LOG_DEBUG_RATE", "20"))  # Per call site
+
+# Chatty libraries, quiet unless AI_LOG_LEVELS says otherwise
+DEFAULT_LOGGER_LEVELS = {"httpx": "WARNING", "httpcore": "WARNING", "urllib3": "WARNING", "PIL": "WARNING"}
+
+# Loggers that servers set up with their own synchronous handlers
+SERVER_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_session_id: ContextVar[Optional[str]] = ContextVar("log_session_id", default=None)
+
+_stats = {"dropped_queue_full": 0, "dropped_sampled": 0, "dropped_rate_limited": 0}
+_listener: Optional[QueueListener] = None
+_log_queue: Optional[queue.Queue] = None
+
+
+def bind_session_id(session_id: Optional[str]):
+    _session_id.set(session_id)
+
+
+class ContextFilter(logging.Filter):
+    """Stamps records with request/session/trace IDs (runs on the caller's thread, so it sees its contextvars)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        record.session_id = _session_id.get()
+        span = current_span()
+        record.trace_id = span.context.trace_id if span else None
+        record.span_id = span.context.span_id if span else None
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    Thins out DEBUG records: keeps a random `sample_rate` share, then at most
+    `rate_per_second` per call site (token bucket keyed by file and line).
+    INFO and above always pass.
+    """
+
+    def __init__(self, sample_rate: float = DEBUG_SAMPLE_RATE, rate_per_second: float = DEBUG_RATE_PER_SECOND):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.rate_per_second = rate_per_second
+        self._buckets: Dict[Tuple[str, int], Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            _stats["dropped_sampled"] += 1
+            return False
+        if self.rate_per_second <= 0:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.rate_per_second, now))
+            tokens = min(self.rate_per_second, tokens + (now - updated) * self.rate_per_second)
+            if tokens < 1.0:
+                self._buckets[key] = (tokens, now)
+                _stats["dropped_rate_limited"] += 1
+                return False
+            self._buckets[key] = (tokens - 1.0, now)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in ("request_id", "session_id", "trace_id", "span_id"):
+            value = getattr(record, key, None)
+            if value:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Merge args and render any traceback now; everything else is left to the writer thread."""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _stats["dropped_queue_full"] += 1
+
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.strip().partition("=")
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging():
+    """
+    Route all logging through a bounded queue to a background writer.
+    Idempotent; call once at startup before anything logs.
+    """
+    global _listener, _log_queue
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    _log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = _DroppingQueueHandler(_log_queue)
+    handler.addFilter(DebugSamplingFilter())
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+    # Access and server logs go through the queue and formatter too
+    for name in SERVER_LOGGERS:
+        server_logger = logging.getLogger(name)
+        for existing in list(server_logger.handlers):
+            server_logger.removeHandler(existing)
+        server_logger.propagate = True
+
+    for name, level in {**DEFAULT_LOGGER_LEVELS, **_parse_levels(LOG_LEVELS)}.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(_log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def logging_stats() -> Dict[str, Any]:
+    return {**_stats, "queue_depth": _log_queue.qsize() if _log_queue else 0}
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware that binds a request ID for log records: the caller's
+    X-Request-ID (e.g. from the gateway) or a fresh one, echoed on the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")[:64]
+        request_id = incoming or uuid.uuid4().hex[:16]
+        token = _request_id.set(request_id)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _request_id.reset(token)
@@ -0,0 +1,309 @@
+"""
+Model routing for LLM calls.
+Adds per-call deadlines, hedged requests to a secondary model once the primary
+is slower than its recent p95, and failover when the primary errors.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import functools
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from utils.admission import MAX_IN_FLIGHT
+from utils.tracing import start_span
+from utils.turn_recorder import record_llm_call
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+LLM_DEADLINE_SECONDS = float(os.getenv("AI_LLM_DEADLINE", "20"))
+HEDGE_DELAY_MS = int(os.getenv("AI_HEDGE_DELAY_MS", "4000"))  # Used until enough samples exist
+HEDGE_MIN_DELAY_MS = int(os.getenv("AI_HEDGE_MIN_DELAY_MS", "500"))
+HEDGE_PERCENTILE = float(os.getenv("AI_HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+# Primary + hedge per admitted turn; abandoned hedges hold a thread until their HTTP call returns
+LLM_WORKERS = int(os.getenv("AI_LLM_WORKERS", str(2 * MAX_IN_FLIGHT)))
+
+# LLM calls get their own threads: on the default executor they queued behind
+# tool calls and image work, and queued primaries then triggered hedges that queued too
+_llm_executor = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+
+_STREAM_END = object()
+
+
+class LLMUnavailableError(Exception):
+    """Raised when neither the primary nor the secondary model answered in time."""
+
+
+async def _run_in_llm_pool(func: Callable, *args):
+    """Like asyncio.to_thread (context included), but on the LLM pool."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_llm_executor, functools.partial(context.run, func, *args))
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct * len(ordered))) - 1))
+    return ordered[index]
+
+
+class ModelRouter:
+    """
+    Routes chat completions between a primary and a secondary model.
+
+    The primary model is called first. If it has not answered after the hedge
+    delay (its observed p95 latency), the same request is sent to the secondary
+    model and whichever finishes first wins. An error from one model
+    immediately starts (or waits for) the other.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        primary: str,
+        secondary: Optional[str] = None,
+        deadline: float = LLM_DEADLINE_SECONDS,
+        hedge_delay_ms: int = HEDGE_DELAY_MS,
+        hedge_percentile: float = HEDGE_PERCENTILE,
+    ):
+        self.client = client
+        self.primary = primary
+        self.secondary = secondary
+        self.deadline = deadline
+        self.default_hedge_delay = hedge_delay_ms / 1000.0
+        self.hedge_percentile = hedge_percentile
+
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._stats = {
+            "calls": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "failovers": 0,
+            "errors": 0,
+            "deadline_exceeded": 0,
+            "streams": 0,
+        }
+
+    def hedge_delay(self, model: str) -> float:
+        """Seconds to wait on `model` before hedging."""
+        samples = self._latencies.get(model)
+        if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+            return self.default_hedge_delay
+        return max(HEDGE_MIN_DELAY_MS / 1000.0, _percentile(list(samples), self.hedge_percentile))
+
+    def _record_latency(self, model: str, seconds: float):
+        self._latencies.setdefault(model, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def _call(self, model: str, messages: List[Dict[str, Any]], kwargs: Dict[str, Any]):
+        """Blocking completion call, run in a worker thread."""
+        with start_span("llm.call", {"llm.model": model, "llm.messages": len(messages)}) as span:
+            started = time.monotonic()
+            try:
+                response = self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    timeout=self.deadline,
+                    **kwargs
+                )
+            except Exception as e:
+                record_llm_call(model, messages, kwargs, time.monotonic() - started, error=e)
+                raise
+            self._record_latency(model, time.monotonic() - started)
+            usage = getattr(response, "usage", None)
+            record_llm_call(model, messages, kwargs, time.monotonic() - started, response.choices[0].message, usage)
+            if usage is not None:
+                span.set_attribute("llm.prompt_tokens", getattr(usage, "prompt_tokens", None))
+                span.set_attribute("llm.completion_tokens", getattr(usage, "completion_tokens", None))
+            return response
+
+    def _start(self, model: str, messages: List[Dict[str, Any]], kwargs: Dict[str, Any]) -> asyncio.Task:
+        task = asyncio.ensure_future(_run_in_llm_pool(self._call, model, list(messages), kwargs))
+        task.model = model
+        task.hedge = False
+        return task
+
+    async def complete(
+        self,
+        messages: List[Dict[str, Any]],
+        model: Optional[str] = None,
+        fallback: Optional[str] = None,
+        **kwargs
+    ):
+        """
+        Run a chat completion with hedging and failover.
+
+        Args:
+            messages: Chat history to send
+            model: Model to try first (defaults to the router's primary)
+            fallback: Hedge/failover model (defaults to the router's secondary)
+            **kwargs: Passed through to chat.completions.create
+
+        Returns:
+            The first successful completion response.
+        """
+        with start_span("llm.complete", {"llm.model": model or self.primary, "llm.tools": "tools" in kwargs}) as span:
+            response = await self._route(messages, model, fallback, kwargs)
+            span.set_attribute("llm.served_by", getattr(response, "model", None))
+            return response
+
+    async def _route(self, messages: List[Dict[str, Any]], model: Optional[str], fallback: Optional[str], kwargs: Dict[str, Any]):
+        primary = model or self.primary
+        secondary = fallback if fallback is not None else self.secondary
+        if secondary == primary:
+            secondary = None
+
+        self._stats["calls"] += 1
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.deadline
+        hedge_at = started + self.hedge_delay(primary)
+
+        pending = {self._start(primary, messages, kwargs)}
+        hedged = secondary is None
+        last_error: Optional[BaseException] = None
+
+        try:
+            while pending:
+                now = loop.time()
+                if now >= deadline:
+                    break
+                timeout = deadline - now
+                if not hedged:
+                    timeout = min(timeout, max(0.0, hedge_at - now))
+
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        if task.hedge:
+                            self._stats["hedge_wins"] += 1
+                        return task.result()
+                    last_error = error
+                    self._stats["errors"] += 1
+                    logger.warning(f"LLM call to {task.model} failed: {error}")
+
+                if not hedged and (done or loop.time() >= hedge_at):
+                    # Primary errored (failover) or is slower than usual (hedge)
+                    hedged = True
+                    if done:
+                        self._stats["failovers"] += 1
+                    else:
+                        self._stats["hedged"] += 1
+                    logger.info(f"Routing to secondary model {secondary} ({'failover' if done else 'hedge'})")
+                    backup = self._start(secondary, messages, kwargs)
+                    backup.hedge = not done  # Only a race the secondary won counts as a hedge win
+                    pending.add(backup)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if last_error is not None and loop.time() < deadline:
+            raise LLMUnavailableError(f"All models failed: {last_error}") from last_error
+
+        self._stats["deadline_exceeded"] += 1
+        raise LLMUnavailableError(f"No model answered within {self.deadline:.0f}s")
+
+    def _stream_call(self, model: str, messages: List[Dict[str, Any]], kwargs: Dict[str, Any], emit: Callable[[Any], None]):
+        """Blocking streamed completion, run in a worker thread; hands text deltas to `emit`."""
+        started = time.monotonic()
+        parts: List[str] = []
+        try:
+            with start_span("llm.stream", {"llm.model": model, "llm.messages": len(messages)}) as span:
+                stream = self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    timeout=self.deadline,
+                    stream=True,
+                    **kwargs
+                )
+                for chunk in stream:
+                    text = chunk.choices[0].delta.content if chunk.choices else None
+                    if text:
+                        if not parts:
+                            span.set_attribute("llm.first_token_ms", round((time.time() - span.start_time) * 1000, 1))
+                        parts.append(text)
+                        emit(text)
+                span.set_attribute("llm.chunks", len(parts))
+            record_llm_call(model, messages, kwargs, time.monotonic() - started, {"content": "".join(parts)})
+        except Exception as e:
+            record_llm_call(model, messages, kwargs, time.monotonic() - started, error=e)
+            raise
+        finally:
+            emit(_STREAM_END)
+
+    async def stream(
+        self,
+        messages: List[Dict[str, Any]],
+        on_text: Callable[[str], Awaitable[None]],
+        model: Optional[str] = None,
+        fallback: Optional[str] = None,
+        **kwargs
+    ) -> str:
+        """
+        Stream a chat completion, awaiting `on_text(delta)` as text arrives.
+
+        There is no hedging (the first model's words are already on screen);
+        the secondary model is used only if the primary fails before its
+        first token.
+
+        Returns:
+            The full response text.
+        """
+        primary = model or self.primary
+        secondary = fallback if fallback is not None else self.secondary
+        candidates = [primary] + ([secondary] if secondary and secondary != primary else [])
+
+        self._stats["streams"] += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        last_error: Optional[BaseException] = None
+
+        for candidate in candidates:
+            chunks: asyncio.Queue = asyncio.Queue()
+            emit = lambda item: loop.call_soon_threadsafe(chunks.put_nowait, item)
+            task = asyncio.ensure_future(_run_in_llm_pool(self._stream_call, candidate, list(messages), kwargs, emit))
+            parts: List[str] = []
+            try:
+                while True:
+                    item = await asyncio.wait_for(chunks.get(), timeout=max(0.0, deadline - loop.time()))
+                    if item is _STREAM_END:
+                        break
+                    parts.append(item)
+                    await on_text(item)
+                await task
+                return "".join(parts)
+            except asyncio.TimeoutError:
+                self._stats["deadline_exceeded"] += 1
+                raise LLMUnavailableError(f"No model finished streaming within {self.deadline:.0f}s")
+            except Exception as e:
+                if not (task.done() and not task.cancelled() and task.exception() is e):
+                    raise  # Raised by on_text (e.g. the client went away), not by the model
+                last_error = e
+                self._stats["errors"] += 1
+                logger.warning(f"LLM stream from {candidate} failed: {e}")
+                if parts:
+                    raise LLMUnavailableError(f"Stream from {candidate} broke off: {e}") from e
+                if candidate != candidates[-1]:
+                    self._stats["failovers"] += 1
+
+        raise LLMUnavailableError(f"All models failed: {last_error}") from last_error
+
+    def stats(self) -> Dict[str, Any]:
+        """Routing counters and per-model latency percentiles."""
+        models = {}
+        for model, samples in self._latencies.items():
+            values = list(samples)
+            models[model] = {
+                "samples": len(values),
+                "p50_ms": round(_percentile(values, 0.5) * 1000, 1),
+                "p95_ms": round(_percentile(values, 0.95) * 1000, 1),
+                "hedge_delay_ms": round(self.hedge_delay(model) * 1000, 1),
+            }
+        return {**self._stats, "models": models}
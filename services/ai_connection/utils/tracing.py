@@ -0,0 +1,265 @@
+"""
+Lightweight distributed tracing for the AI service.
+Accepts W3C `traceparent` headers on incoming requests, keeps the active
+span in a ContextVar (so it follows asyncio tasks, to_thread calls and the
+prefetch/job pools), injects `traceparent` on outgoing calls and hands
+finished spans to a pluggable exporter. The built-in exporter writes JSON
+lines to a local file, so no collector is needed.
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import importlib
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+TRACE_EXPORTER = os.getenv("AI_TRACE_EXPORTER", "none")  # none, jsonl, or "module:Class"
+TRACE_FILE = os.getenv("AI_TRACE_FILE", "traces.jsonl")
+TRACE_SAMPLE_RATE = float(os.getenv("AI_TRACE_SAMPLE_RATE", "1.0"))  # For traces started here
+TRACE_QUEUE_SIZE = int(os.getenv("AI_TRACE_QUEUE_SIZE", "10000"))  # Spans waiting to be written
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+@dataclass
+class SpanContext:
+    """The part of a span that crosses process boundaries."""
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[SpanContext]:
+    """Parse a W3C traceparent header (version 00); None if absent or invalid."""
+    match = _TRACEPARENT_RE.match((header or "").strip().lower())
+    if not match:
+        return None
+    trace_id, span_id, flags = match.groups()
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return SpanContext(trace_id, span_id, bool(int(flags, 16) & 1))
+
+
+def format_traceparent(context: SpanContext) -> str:
+    return f"00-{context.trace_id}-{context.span_id}-{'01' if context.sampled else '00'}"
+
+
+@dataclass
+class Span:
+    """A timed operation within a trace."""
+    name: str
+    context: SpanContext
+    parent_id: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    start_time: float = field(default_factory=time.time)
+    end_time: Optional[float] = None
+    status: str = "ok"
+    error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, error: Any):
+        self.status = "error"
+        self.error = str(error)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration_ms": round(((self.end_time or time.time()) - self.start_time) * 1000, 2),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+# --- Exporters -----------------------------------------------------------------
+
+class SpanExporter(ABC):
+    """Base exporter. Subclass and implement export() to ship spans elsewhere."""
+
+    @abstractmethod
+    def export(self, span: Span):
+        """Called on the request path as each sampled span ends; must not block."""
+
+    def shutdown(self):
+        pass
+
+
+class NoopExporter(SpanExporter):
+    def export(self, span: Span):
+        pass
+
+
+class JsonLinesExporter(SpanExporter):
+    """
+    Appends one JSON object per finished span to a local file.
+    Spans are queued and serialized/written by a background thread; when the
+    queue is full they are dropped (and counted) rather than blocking a request.
+    """
+
+    _STOP = object()
+
+    def __init__(self, path: str = TRACE_FILE, queue_size: int = TRACE_QUEUE_SIZE):
+        self.path = path
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._file = open(path, "a", encoding="utf-8")
+        self._writer = threading.Thread(target=self._write_loop, name="span-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.shutdown)
+
+    def export(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_loop(self):
+        while True:
+            span = self._queue.get()
+            if span is self._STOP:
+                break
+            self._file.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+            if self._queue.empty():
+                self._file.flush()
+        self._file.close()
+
+    def shutdown(self):
+        if self._writer.is_alive():
+            self._queue.put(self._STOP)
+            self._writer.join(timeout=5)
+
+
+def _load_exporter(spec: str) -> SpanExporter:
+    """Build the exporter named by AI_TRACE_EXPORTER."""
+    if spec in ("", "none"):
+        return NoopExporter()
+    if spec == "jsonl":
+        return JsonLinesExporter()
+    try:
+        module_name, _, attr = spec.partition(":")
+        return getattr(importlib.import_module(module_name), attr)()
+    except Exception as e:
+        logger.error(f"Could not load trace exporter '{spec}', tracing disabled: {e}")
+        return NoopExporter()
+
+
+_exporter: SpanExporter = _load_exporter(TRACE_EXPORTER)
+
+
+def set_exporter(exporter: SpanExporter):
+    """Replace the span exporter (e.g. with an OTLP shipper)."""
+    global _exporter
+    _exporter.shutdown()
+    _exporter = exporter
+
+
+def tracing_enabled() -> bool:
+    return not isinstance(_exporter, NoopExporter)
+
+
+# --- Spans ---------------------------------------------------------------------
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+@contextmanager
+def start_span(
+    name: str,
+    attributes: Optional[Dict[str, Any]] = None,
+    parent: Optional[SpanContext] = None
+) -> Iterator[Span]:
+    """
+    Start a span as a child of the current one (or of `parent`, e.g. an
+    incoming traceparent) and make it current for the duration of the block.
+    Exceptions raised in the block mark the span as failed.
+    """
+    current = _current_span.get()
+    parent_context = parent or (current.context if current else None)
+    if parent_context:
+        context = SpanContext(parent_context.trace_id, _new_id(64), parent_context.sampled)
+    else:
+        context = SpanContext(_new_id(128), _new_id(64), random.random() < TRACE_SAMPLE_RATE)
+
+    span = Span(name, context, parent_context.span_id if parent_context else None, dict(attributes or {}))
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end_time = time.time()
+        if context.sampled:
+            try:
+                _exporter.export(span)
+            except Exception as e:
+                logger.debug("Span export failed: %s", e)
+
+
+def inject_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    """Add the current span's traceparent to outgoing request headers."""
+    span = _current_span.get()
+    if span:
+        headers["traceparent"] = format_traceparent(span.context)
+    return headers
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that opens a server span per HTTP request, continuing the
+    caller's trace when a valid `traceparent` header is present. The trace ID
+    is echoed back in an X-Trace-Id response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        parent = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        name = f"{scope['method']} {scope['path']}"
+
+        with start_span(name, {"http.method": scope["method"], "http.path": scope["path"]}, parent=parent) as span:
+            async def traced_send(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.status = "error"
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"x-trace-id", span.context.trace_id.encode())]
+                await send(message)
+
+            await self.app(scope, receive, traced_send)
@@ -0,0 +1,175 @@
+"""
+Turn recorder for record-and-replay testing.
+Captures each chat turn's LLM calls, tool calls and product-service requests
+(with timings and estimated prompt tokens) into a JSON-lines file, so
+scripts/replay_turns.py can replay real conversations and spot prompt or
+tool changes that add round-trips.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+RECORD_FILE = os.getenv("AI_RECORD_TURNS", "")  # Path to append recorded turns to; empty = off
+CHARS_PER_TOKEN = 4  # Rough estimate, applied the same way when recording and replaying
+
+
+@dataclass
+class TurnRecord:
+    """
+    Everything one call to process_user_query did while the farmer waited.
+    Work that outlives the turn (queued background jobs) is not counted.
+    """
+    session: str
+    input: str
+    language: str = "auto"
+    conversation_id: Optional[str] = None
+    background: bool = False
+    recorded_at: float = field(default_factory=time.time)
+    response: Optional[str] = None
+    action: Optional[str] = None
+    duration_ms: float = 0.0
+    llm_calls: List[Dict[str, Any]] = field(default_factory=list)
+    tool_calls: List[Dict[str, Any]] = field(default_factory=list)
+    http_requests: List[Dict[str, Any]] = field(default_factory=list)
+    closed: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        entry = asdict(self)
+        del entry["closed"]
+        return entry
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "llm_calls": len(self.llm_calls),
+            "tool_calls": len(self.tool_calls),
+            "http_requests": len(self.http_requests),
+            "prompt_tokens": sum(call.get("prompt_tokens_est", 0) for call in self.llm_calls),
+        }
+
+
+_current_turn: ContextVar[Optional[TurnRecord]] = ContextVar("current_turn", default=None)
+_sink: Optional[Callable[[TurnRecord], None]] = None
+_file_lock = threading.Lock()
+
+
+def _write_to_file(turn: TurnRecord):
+    line = json.dumps(turn.to_dict(), ensure_ascii=False, default=str)
+    with _file_lock, open(RECORD_FILE, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+if RECORD_FILE:
+    _sink = _write_to_file
+
+
+def set_turn_sink(sink: Optional[Callable[[TurnRecord], None]]):
+    """Send finished turns somewhere else (the replay runner collects them in memory)."""
+    global _sink
+    _sink = sink
+
+
+def _field(obj: Any, name: str) -> Any:
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+def _tool_calls(message: Any) -> List[Dict[str, str]]:
+    return [
+        {"id": _field(call, "id"), "name": _field(_field(call, "function"), "name"),
+         "arguments": _field(_field(call, "function"), "arguments")}
+        for call in _field(message, "tool_calls") or []
+    ]
+
+
+def estimate_prompt_tokens(messages: List[Any], tools: Optional[List[Dict[str, Any]]] = None) -> int:
+    """Approximate prompt size: message text, tool-call arguments and tool schemas."""
+    chars = 0
+    for message in messages:
+        chars += len(str(_field(message, "content") or "")) + 16  # Role/formatting overhead
+        chars += sum(len(call["name"] or "") + len(call["arguments"] or "") for call in _tool_calls(message))
+    if tools:
+        chars += len(json.dumps(tools))
+    return chars // CHARS_PER_TOKEN
+
+
+@contextmanager
+def recording_turn(session: str, user_input: str, language: str, conversation_id: Optional[str], background: bool) -> Iterator[Optional[TurnRecord]]:
+    """Record the turn run inside the block (no-op unless a sink is configured)."""
+    if _sink is None:
+        yield None
+        return
+
+    turn = TurnRecord(session, user_input, language, conversation_id, background)
+    token = _current_turn.set(turn)
+    started = time.monotonic()
+    try:
+        yield turn
+    finally:
+        _current_turn.reset(token)
+        turn.closed = True  # Job threads still hold a copy of the context
+        turn.duration_ms = round((time.monotonic() - started) * 1000, 1)
+        try:
+            _sink(turn)
+        except Exception as e:
+            logger.warning(f"Could not record turn: {e}")
+
+
+def detach_turn():
+    """
+    Stop recording into the current turn from this context. For speculative
+    background work whose cost is recorded by the turn once it is used or
+    discarded, so the count does not depend on when it finishes.
+    """
+    _current_turn.set(None)
+
+
+def record_llm_call(
+    model: str,
+    messages: List[Any],
+    kwargs: Dict[str, Any],
+    seconds: float,
+    message: Any = None,
+    usage: Any = None,
+    error: Optional[BaseException] = None
+):
+    turn = _current_turn.get()
+    if turn is None or turn.closed:
+        return
+    turn.llm_calls.append({
+        "model": model,
+        "messages": len(messages),
+        "with_tools": bool(kwargs.get("tools")),
+        "prompt_tokens_est": estimate_prompt_tokens(messages, kwargs.get("tools")),
+        "prompt_tokens": _field(usage, "prompt_tokens") if usage is not None else None,
+        "latency_ms": round(seconds * 1000, 1),
+        "response": {"content": _field(message, "content"), "tool_calls": _tool_calls(message)} if message is not None else None,
+        "error": str(error) if error else None,
+    })
+
+
+def record_tool_call(name: str, arguments: Dict[str, Any], result: Any, seconds: float):
+    turn = _current_turn.get()
+    if turn is None or turn.closed:
+        return
+    turn.tool_calls.append({
+        "name": name,
+        "arguments": arguments,
+        "result": str(result)[:500],
+        "latency_ms": round(seconds * 1000, 1),
+    })
+
+
+def record_http(method: str, path: str, status: Optional[int], seconds: float):
+    turn = _current_turn.get()
+    if turn is None or turn.closed:
+        return
+    turn.http_requests.append({"method": method, "path": path, "status": status, "latency_ms": round(seconds * 1000, 1)})
@@ -0,0 +1,165 @@
+"""
+Streaming upload handling for image chat.
+Caps request bodies while they stream in, keeps uploads in spooled temp
+files (memory for small files, disk for large ones) and validates images
+from their header alone before anything decodes the pixels.
+"""
+
+import os
+import tempfile
+import logging
+from typing import BinaryIO, Iterable, Tuple
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from PIL import Image, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+MAX_UPLOAD_BYTES = int(os.getenv("AI_MAX_UPLOAD_MB", "10")) * 1024 * 1024
+SPOOL_MEMORY_BYTES = int(os.getenv("AI_UPLOAD_SPOOL_KB", "512")) * 1024  # Larger uploads go to disk
+UPLOAD_CHUNK_BYTES = 64 * 1024
+FORM_OVERHEAD_BYTES = 64 * 1024  # Multipart boundaries and the text fields next to the file
+MAX_IMAGE_PIXELS = int(os.getenv("AI_MAX_IMAGE_PIXELS", "40000000"))  # ~40MP
+MAX_IMAGE_SIDE = int(os.getenv("AI_MAX_IMAGE_SIDE", "12000"))
+ALLOWED_FORMATS = {"JPEG", "PNG", "WEBP"}
+
+# Make Pillow itself refuse decompression bombs beyond our limit
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+
+class UploadRejected(Exception):
+    """Upload failed a size or format check. Carries the HTTP status to return."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def _too_large_message(max_bytes: int) -> str:
+    return f"Image too large. Maximum upload size is {max_bytes // (1024 * 1024)}MB."
+
+
+class BodySizeLimitMiddleware:
+    """
+    ASGI middleware that caps request bodies on upload routes.
+
+    Requests declaring a larger Content-Length are refused before a byte of
+    the body is read; chunked bodies are counted as they stream and aborted
+    with 413 as soon as they cross the limit.
+    """
+
+    def __init__(self, app, paths: Iterable[str], max_bytes: int = MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        message = _too_large_message(self.max_bytes - FORM_OVERHEAD_BYTES)
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = JSONResponse({"detail": message}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            event = await receive()
+            if event["type"] == "http.request":
+                received += len(event.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=message)
+            return event
+
+        await self.app(scope, limited_receive, send)
+
+
+async def spool_upload(upload, max_bytes: int = MAX_UPLOAD_BYTES) -> BinaryIO:
+    """
+    Return the upload as a seekable, spooled file, enforcing the size cap.
+
+    Starlette's form parser already spools file parts (to disk past 1MB), so
+    that file is reused as-is when its size is known. Otherwise the upload is
+    copied chunk by chunk into a SpooledTemporaryFile, stopping as soon as the
+    cap is exceeded.
+
+    Returns:
+        The spooled file, rewound to the start.
+    """
+    declared = getattr(upload, "size", None)
+    if declared is not None and declared > max_bytes:
+        raise UploadRejected(_too_large_message(max_bytes), 413)
+    if declared is not None and getattr(upload, "file", None) is not None:
+        if declared == 0:
+            raise UploadRejected("The uploaded image is empty.", 400)
+        upload.file.seek(0)
+        return upload.file
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+    total = 0
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > max_bytes:
+                raise UploadRejected(_too_large_message(max_bytes), 413)
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+
+    if total == 0:
+        spool.close()
+        raise UploadRejected("The uploaded image is empty.", 400)
+
+    spool.seek(0)
+    return spool
+
+
+def probe_image(fileobj: BinaryIO) -> Tuple[str, Tuple[int, int]]:
+    """
+    Validate an image from its header only (no pixel decode).
+    Rejects unsupported formats, oversized dimensions and decompression bombs.
+
+    Returns:
+        Tuple of (format, (width, height)); the file is rewound afterwards.
+    """
+    fileobj.seek(0)
+    try:
+        with Image.open(fileobj) as image:  # Lazy: reads the header, not the pixels
+            image_format, size = image.format, image.size
+    except Image.DecompressionBombError:
+        raise UploadRejected("Image dimensions are too large.", 413)
+    except UnidentifiedImageError:
+        raise UploadRejected("Invalid image: not a recognised image file.", 415)
+    except Exception as e:
+        raise UploadRejected(f"Invalid image: {e}", 415)
+    finally:
+        fileobj.seek(0)
+
+    if image_format not in ALLOWED_FORMATS:
+        raise UploadRejected(f"Unsupported image format {image_format}. Please upload a JPEG, PNG or WebP photo.", 415)
+
+    width, height = size
+    if width <= 0 or height <= 0 or max(width, height) > MAX_IMAGE_SIDE or width * height > MAX_IMAGE_PIXELS:
+        raise UploadRejected(f"Image dimensions {width}x{height} are too large.", 413)
+
+    return image_format, size
+
+
+def file_size(fileobj: BinaryIO) -> int:
+    """Size of a seekable file without reading it."""
+    position = fileobj.tell()
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(position)
+    return size
@@ -2,17 +2,46 @@ const Product = require('../models/Product');
 const Farmer = require('../models/Farmer');
 const { AppError, asyncHandler } = require('../../shared/middleware/errorHandler');
 
+const IMAGE_VIEWS = ['thumbnail', 'card'];
+// What search indexes need from the change feed (it is public, and includes delisted products)
+const CHANGE_FEED_FIELDS = '_id productName description category ownerName city price currentQuantity isActive updatedAt';
+
 exports.getProducts = asyncHandler(async (req, res) => {
     const page = parseInt(req.query.page, 10) || 1;
     const limit = parseInt(req.query.limit, 10) || 20;
     const startIndex = (page - 1) * limit;
-
-    const products = await Product.find({ isActive: true, currentQuantity: { $gt: 0 } })
-        .sort({ createdAt: -1 })
+    const view = [...IMAGE_VIEWS, 'summary'].includes(req.query.view) ? req.query.view : null;
+    const updatedSince = req.query.updatedSince ? new Date(req.query.updatedSince) : null;
+    const isChangeFeed = updatedSince && !isNaN(updatedSince);
+
+    // Change feed (used by search indexes): everything touched since the cursor,
+    // including deactivated and sold-out products so they can be evicted
+    const filter = isChangeFeed
+        ? { updatedAt: { $gte: updatedSince } }
+        : { isActive: true, currentQuantity: { $gt: 0 } };
+
+    let query = Product.find(filter)
+        .sort(isChangeFeed ? { updatedAt: 1 } : { createdAt: -1 })
         .skip(startIndex)
         .limit(limit);
+    // Change feed: index fields only, whatever view was asked for
+    if (isChangeFeed) query = query.select(CHANGE_FEED_FIELDS);
+    // Summary view: no image payloads at all
+    else if (view === 'summary') query = query.select('-image -imageRenditions');
+
+    let products = await query;
+
+    // List views: swap the full image for the requested rendition when one exists
+    if (IMAGE_VIEWS.includes(view) && !isChangeFeed) {
+        products = products.map((product) => {
+            const json = product.toJSON();
+            json.image = json.imageRenditions?.[view] || json.image;
+            delete json.imageRenditions;
+            return json;
+        });
+    }
 
-    const total = await Product.countDocuments({ isActive: true, currentQuantity: { $gt: 0 } });
+    const total = await Product.countDocuments(filter);
 
     res.json({
         success: true,
@@ -28,19 +57,25 @@ exports.getProducts = asyncHandler(async (req, res) => {
 });
 
 exports.getProduct = asyncHandler(async (req, res, next) => {
-    const product = await Product.findById(req.params.id).populate('owner', 'name email phno');
+    // Summary view: listing fields only, no image payloads or owner details
+    const product = req.query.view === 'summary'
+        ? await Product.findById(req.params.id).select('-image -imageRenditions')
+        : await Product.findById(req.params.id).populate('owner', 'name email phno');
     if (!product) return next(new AppError('Product not found', 404));
     res.json({ success: true, product });
 });
 
 exports.getMyProducts = asyncHandler(async (req, res, next) => {
     const farmer = req.user;
-    const products = await Product.find({ owner: farmer._id, isActive: true }).sort({ createdAt: -1 });
+    let query = Product.find({ owner: farmer._id, isActive: true }).sort({ createdAt: -1 });
+    // Summary view: no image payloads at all (the AI service only indexes names and stock)
+    if (req.query.view === 'summary') query = query.select('-image -imageRenditions');
+    const products = await query;
     res.json({ success: true, count: products.length, products });
 });
 
 exports.createProduct = asyncHandler(async (req, res, next) => {
-    const { productName, description, category, quantity, price, image } = req.body;
+    const { productName, description, category, quantity, price, image, imageRenditions } = req.body;
     const farmer = req.user;
 
     const product = await Product.create({
@@ -53,6 +88,7 @@ exports.createProduct = asyncHandler(async (req, res, next) => {
         currentQuantity: quantity,
         price,
         image: image || 'https://images.unsplash.com/photo-1542838132-92c53300491e?w=400',
+        ...(image && imageRenditions && { imageRenditions }),
         state: farmer.state,
         city: farmer.city,
         pin: farmer.pin
@@ -66,7 +102,7 @@ exports.createProduct = asyncHandler(async (req, res, next) => {
 });
 
 exports.updateProduct = asyncHandler(async (req, res, next) => {
-    const { productName, description, category, quantity, price, image, isActive } = req.body;
+    const { productName, description, category, quantity, price, image, imageRenditions, isActive } = req.body;
     const product = await Product.findById(req.params.id);
     if (!product) return next(new AppError('Product not found', 404));
 
@@ -77,6 +113,8 @@ exports.updateProduct = asyncHandler(async (req, res, next) => {
         ...(category && { category }), ...(quantity !== undefined && { allocatedQuantity: quantity, currentQuantity: quantity }),
         ...(price && { price }), ...(image && { image }), ...(isActive !== undefined && { isActive })
     });
+    // A new image invalidates old renditions unless fresh ones were sent with it
+    if (image) product.imageRenditions = imageRenditions || undefined;
     await product.save();
 
     res.json({ success: true, product });
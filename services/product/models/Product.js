@@ -6,6 +6,11 @@ const productSchema = new mongoose.Schema({
     price: { type: Number, required: true },
     category: { type: String, required: true },
     image: { type: String, required: true },
+    // Smaller variants of `image` for list views (e.g. thumbnail, card)
+    imageRenditions: {
+        thumbnail: { type: String },
+        card: { type: String }
+    },
     currentQuantity: { type: Number, required: true, default: 0 },
     allocatedQuantity: { type: Number, default: 0 },
     owner: { type: mongoose.Schema.Types.ObjectId, ref: 'Farmer', required: true },
@@ -24,6 +29,7 @@ productSchema.index({ productName: 'text', description: 'text', category: 'text'
 productSchema.index({ category: 1, city: 1, state: 1 });
 productSchema.index({ owner: 1 });
 productSchema.index({ isActive: 1 });
+productSchema.index({ updatedAt: 1 });
 
 // Virtual for available quantity
 productSchema.virtual('availableQuantity').get(function () {